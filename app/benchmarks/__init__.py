@@ -0,0 +1,6 @@
+"""
+Micro-benchmarks that need no database or Supabase project.
+
+Usage:
+    python -m app.benchmarks.serialization   # response serialization, old vs fast path
+"""
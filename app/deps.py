@@ -1,36 +1,63 @@
-from fastapi import Depends, HTTPException, status, Request
+from fastapi import Depends, HTTPException, status, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
-from typing import List, Optional, Tuple
+from sqlalchemy import select, func, distinct, literal, literal_column, cast, String
+from sqlalchemy.dialects.postgresql import JSONB
+from typing import FrozenSet, Iterable, List, Optional, Tuple
 from uuid import UUID
-import jwt
 
-from app.database import get_db
+from app.database import (
+    AsyncSessionLocal,
+    ReadSessionLocal,
+    get_read_db,
+    is_replica_session,
+    read_session_factory,
+    reads_from_primary,
+)
 from app.config import get_settings
 from app.models.usuario import Usuario
 from app.models.empresa import Empresa
 from app.models.rol import Rol, RolPermiso, UsuarioRol
 from app.models.permiso import Permiso
-from app.services.supabase_service import get_supabase_auth_client
+from app.services.token_service import verify_access_token, expires_within
+from app.services.auth_service import session_refresher
+from app.services.token_revocation import revocation_list
+from app.services.claims_token import claims_signer, permission_catalog
+from app.services.data_version import version_subquery, CATALOGO_PERMISOS
+from app.services.principal_cache import (
+    principal_cache,
+    Principal,
+    UsuarioSnapshot,
+    EmpresaSnapshot,
+    RolSnapshot,
+    PermisoSnapshot,
+    build_permission_index,
+)
 from app.schemas.auth import UserResponse, EmpresaInfo, RolInfo, PermisoInfo
 
 settings = get_settings()
 
 
 class CurrentUser:
-    """Container for current user data."""
+    """Container for current user data (immutable snapshots, not ORM objects)."""
     def __init__(
         self,
-        usuario: Usuario,
-        empresa: Empresa,
-        roles: List[Rol],
-        permisos: List[Permiso]
+        usuario: UsuarioSnapshot,
+        empresa: EmpresaSnapshot,
+        roles: List[RolSnapshot],
+        permisos: List[PermisoSnapshot],
+        permission_index: Optional[FrozenSet[Tuple[str, str]]] = None,
+        versiones: Tuple[int, int] = (0, 0),
     ):
         self.usuario = usuario
         self.empresa = empresa
         self.roles = roles
         self.permisos = permisos
+        # Data versions the snapshots were loaded at (see app.services.data_version)
+        self.versiones = versiones
+        # (accion, recurso) pairs; reused from the cached principal when available
+        if permission_index is None:
+            permission_index = build_permission_index(permisos)
+        self.permission_index = permission_index
     
     def has_permission(self, action: str, resource: str) -> bool:
         """Check if user has specific permission."""
@@ -39,28 +66,36 @@ class CurrentUser:
             return True
         
         # Check if user has the permission through roles
-        for permiso in self.permisos:
-            if permiso.accion == action and permiso.recurso == resource:
-                return True
+        return (action, resource) in self.permission_index
+    
+    def has_permissions(self, checks: Iterable[Tuple[str, str]]) -> List[bool]:
+        """Check several (action, resource) pairs at once, preserving order."""
+        if self.usuario.es_dueno:
+            return [True for _ in checks]
         
-        return False
+        index = self.permission_index
+        return [(action, resource) in index for action, resource in checks]
     
     def to_user_response(self) -> UserResponse:
-        """Convert to UserResponse schema."""
-        return UserResponse(
+        """Convert to UserResponse schema.
+        
+        Built with `model_construct`: the snapshots come from the database
+        and already satisfy the schema, so validating them again is wasted work.
+        """
+        return UserResponse.model_construct(
             id_usuario=self.usuario.id_usuario,
             nombre=self.usuario.nombre,
             apellido=self.usuario.apellido,
             email=self.usuario.email,
             es_dueno=self.usuario.es_dueno,
-            empresa=EmpresaInfo(
+            empresa=EmpresaInfo.model_construct(
                 id_empresa=self.empresa.id_empresa,
                 nombre=self.empresa.nombre,
                 razon_social=self.empresa.razon_social,
                 nit=self.empresa.nit,
             ),
             roles=[
-                RolInfo(
+                RolInfo.model_construct(
                     id_rol=rol.id_rol,
                     nombre=rol.nombre,
                     descripcion=rol.descripcion,
@@ -68,7 +103,7 @@ class CurrentUser:
                 for rol in self.roles
             ],
             permisos=[
-                PermisoInfo(
+                PermisoInfo.model_construct(
                     id_permiso=permiso.id_permiso,
                     accion=permiso.accion,
                     recurso=permiso.recurso,
@@ -78,81 +113,183 @@ class CurrentUser:
         )
 
 
-async def _get_current_user_from_token(
-    access_token: str,
-    db: AsyncSession,
-) -> CurrentUser:
-    """Internal function to get user from validated token."""
-    supabase = get_supabase_auth_client()
-    
-    try:
-        # Verify token with Supabase
-        # Supabase validates the token signature
-        user_response = supabase.auth.get_user(access_token)
-        
-        if not user_response or not user_response.user:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid authentication credentials",
+def _principal_query(auth_uid: UUID):
+    """
+    Build the single statement that resolves a principal.
+
+    Returns one row: the user, its company (outer join), two JSON arrays
+    with the user's roles in that company and the distinct permissions
+    granted by them, and the company and catalog data versions.
+    """
+    roles_json = (
+        select(
+            func.coalesce(
+                func.jsonb_agg(
+                    func.jsonb_build_object(
+                        "id_rol", Rol.id_rol,
+                        "nombre", Rol.nombre,
+                        "descripcion", Rol.descripcion,
+                    )
+                ),
+                literal_column("'[]'::jsonb"),
+                type_=JSONB,
             )
-        
-        auth_uid = UUID(user_response.user.id)
-        
-        # Get user from database
-        result = await db.execute(
-            select(Usuario)
-            .options(selectinload(Usuario.empresa))
-            .where(Usuario.auth_uid == auth_uid)
         )
-        usuario = result.scalar_one_or_none()
-        
-        if not usuario:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="User not found",
-            )
-        
-        if not usuario.estado:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="User account is disabled",
-            )
-        
-        # Get empresa
-        empresa = usuario.empresa
-        if not empresa or not empresa.estado:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Company account is disabled",
-            )
-        
-        # Get user roles
-        roles_result = await db.execute(
-            select(Rol)
-            .join(UsuarioRol)
-            .where(UsuarioRol.usuarios_id_usuario == usuario.id_usuario)
-            .where(Rol.empresas_id_empresa == empresa.id_empresa)
-        )
-        roles = roles_result.scalars().all()
-        
-        # Get permissions from roles
-        permisos: List[Permiso] = []
-        if roles:
-            roles_ids = [rol.id_rol for rol in roles]
-            permisos_result = await db.execute(
-                select(Permiso)
-                .join(RolPermiso)
-                .where(RolPermiso.roles_id_rol.in_(roles_ids))
+        .select_from(UsuarioRol)
+        .join(Rol, Rol.id_rol == UsuarioRol.roles_id_rol)
+        .where(UsuarioRol.usuarios_id_usuario == Usuario.id_usuario)
+        .where(Rol.empresas_id_empresa == Usuario.empresas_id_empresa)
+        .scalar_subquery()
+    )
+    
+    permisos_json = (
+        select(
+            func.coalesce(
+                func.jsonb_agg(
+                    distinct(
+                        func.jsonb_build_object(
+                            "id_permiso", Permiso.id_permiso,
+                            "accion", Permiso.accion,
+                            "recurso", Permiso.recurso,
+                        )
+                    )
+                ),
+                literal_column("'[]'::jsonb"),
+                type_=JSONB,
             )
-            permisos = list(set(permisos_result.scalars().all()))  # Remove duplicates
+        )
+        .select_from(UsuarioRol)
+        .join(Rol, Rol.id_rol == UsuarioRol.roles_id_rol)
+        .join(RolPermiso, RolPermiso.roles_id_rol == Rol.id_rol)
+        .join(Permiso, Permiso.id_permiso == RolPermiso.permisos_id_permiso)
+        .where(UsuarioRol.usuarios_id_usuario == Usuario.id_usuario)
+        .where(Rol.empresas_id_empresa == Usuario.empresas_id_empresa)
+        .scalar_subquery()
+    )
+    
+    return (
+        select(
+            Usuario,
+            Empresa,
+            roles_json.label("roles"),
+            permisos_json.label("permisos"),
+            version_subquery(
+                literal("empresa:") + cast(Usuario.empresas_id_empresa, String)
+            ).label("version_empresa"),
+            version_subquery(CATALOGO_PERMISOS).label("version_catalogo"),
+        )
+        .outerjoin(Empresa, Empresa.id_empresa == Usuario.empresas_id_empresa)
+        .where(Usuario.auth_uid == auth_uid)
+    )
+
+
+async def _load_principal(auth_uid: UUID, db: AsyncSession) -> Optional[Principal]:
+    """Load user, company, roles and permissions in one round trip."""
+    result = await db.execute(_principal_query(auth_uid))
+    row = result.one_or_none()
+    
+    if not row:
+        return None
+    
+    usuario, empresa, roles, permisos, version_empresa, version_catalogo = row
+    
+    return Principal(
+        usuario=UsuarioSnapshot.from_model(usuario),
+        empresa=EmpresaSnapshot.from_model(empresa) if empresa else None,
+        # Roles are only resolved within the user's own company
+        roles=tuple(RolSnapshot(**rol) for rol in roles) if empresa else (),
+        permisos=tuple(PermisoSnapshot(**permiso) for permiso in permisos) if empresa else (),
+        versiones=(version_empresa, version_catalogo),
+    )
+
+
+async def _load_and_cache_principal(auth_uid: UUID, db: AsyncSession) -> Optional[Principal]:
+    """Load a principal after a cache miss and cache it."""
+    principal = await _load_principal(auth_uid, db)
+    if (
+        principal is not None
+        and is_replica_session(db)
+        and reads_from_primary(principal.usuario.empresas_id_empresa)
+    ):
+        # The company wrote moments ago; the replica may not have the change yet
+        async with AsyncSessionLocal() as primary:
+            principal = await _load_principal(auth_uid, primary)
+    if principal is not None:
+        principal_cache.set(auth_uid, principal)
+    return principal
+
+
+def _check_active(principal: Optional[Principal]) -> Principal:
+    """404/403 unless the user and its company exist and are enabled."""
+    if not principal:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found",
+        )
+    
+    if not principal.usuario.estado:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="User account is disabled",
+        )
+    
+    empresa = principal.empresa
+    if not empresa or not empresa.estado:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Company account is disabled",
+        )
+    
+    return principal
+
+
+async def get_current_user_for_auth_uid(
+    auth_uid: UUID,
+    db: AsyncSession,
+) -> CurrentUser:
+    """
+    Resolve the principal of an already authenticated `auth_uid`.
+
+    Used after token verification and directly by login, whose sign-in
+    response already proves the identity.
+    """
+    try:
+        # Get user, company, roles and permissions (cached per auth_uid)
+        principal = principal_cache.get(auth_uid)
+        if principal is None:
+            principal = await _load_and_cache_principal(auth_uid, db)
+        principal = _check_active(principal)
         
         return CurrentUser(
-            usuario=usuario,
-            empresa=empresa,
-            roles=list(roles),
-            permisos=permisos,
+            usuario=principal.usuario,
+            empresa=principal.empresa,
+            roles=list(principal.roles),
+            permisos=list(principal.permisos),
+            permission_index=principal.permission_index,
+            versiones=principal.versiones,
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=f"Could not validate credentials: {str(e)}",
+        )
+
+
+async def _verify_not_revoked(access_token: str) -> UUID:
+    """`auth_uid` of a valid access token that was not revoked by logout."""
+    # Revoked by logout: in-process denylist, no database round trip
+    if revocation_list.is_revoked(access_token):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked",
         )
     
+    try:
+        # Verify token signature and claims (locally, or with Supabase as fallback)
+        return await verify_access_token(access_token)
     except HTTPException:
         raise
     except Exception as e:
@@ -162,16 +299,87 @@ async def _get_current_user_from_token(
         )
 
 
+async def get_principal_for_token(access_token: str) -> Principal:
+    """
+    Cheapest path from an access token to an active principal.
+
+    For forward auth: no CurrentUser is built and no session is opened
+    unless the principal is missing from the cache. Only answers 401 or
+    403 on failure, the codes nginx `auth_request` passes through.
+    """
+    auth_uid = await _verify_not_revoked(access_token)
+    principal = principal_cache.get(auth_uid)
+    if principal is None:
+        try:
+            async with ReadSessionLocal() as db:
+                principal = await _load_and_cache_principal(auth_uid, db)
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail=f"Could not validate credentials: {str(e)}",
+            )
+    if principal is None:
+        # A valid token without a local user: unknown here, not a missing resource
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User not found",
+        )
+    return _check_active(principal)
+
+
+async def _get_current_user_from_token(
+    access_token: str,
+    db: AsyncSession,
+) -> CurrentUser:
+    """Internal function to get user from validated token."""
+    auth_uid = await _verify_not_revoked(access_token)
+    return await get_current_user_for_auth_uid(auth_uid, db)
+
+
+def bearer_token(request: Request) -> Optional[str]:
+    """The token of an `Authorization: Bearer <token>` header, if any."""
+    authorization = request.headers.get("authorization")
+    if not authorization:
+        return None
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token.strip():
+        return None
+    return token.strip()
+
+
 async def get_current_user(
     request: Request,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ) -> CurrentUser:
     """
     Dependency to get current authenticated user.
-    Validates the JWT token from HTTP-only cookie and retrieves user data.
+    Validates the JWT token from HTTP-only cookie (or an `Authorization: Bearer`
+    header, for service-to-service calls) and retrieves user data.
     """
     cookie_name = settings.cookie_name
     access_token = request.cookies.get(cookie_name)
+    refresh_token = request.cookies.get(settings.refresh_cookie_name)
+    
+    cookie_session = bool(access_token or refresh_token)
+    if not cookie_session:
+        access_token = bearer_token(request)
+    
+    # Refresh server-side shortly before the access token expires, so clients
+    # never see the hourly 401 and never have to sign in again
+    if refresh_token and (
+        not access_token
+        or expires_within(access_token, settings.token_refresh_margin_seconds)
+    ):
+        try:
+            tokens = await session_refresher.refresh(refresh_token)
+        except HTTPException:
+            # Keep using the current token while it is still valid
+            if not access_token:
+                raise
+        else:
+            access_token = tokens["access_token"]
+            # Written to the response by the refreshed_session_cookies middleware
+            request.state.refreshed_tokens = tokens
     
     if not access_token:
         raise HTTPException(
@@ -179,13 +387,10 @@ async def get_current_user(
             detail="Not authenticated - missing cookie",
         )
     
-    # Parse the cookie value (assuming format: access_token;refresh_token or JSON)
-    # Supabase typically stores tokens separately, but for simplicity,
-    # we'll expect the cookie to contain the access_token directly
-    # If you need to store both, you might use a JSON structure
+    # The access cookie holds the raw JWT; the refresh token has its own cookie
     
     try:
-        return await _get_current_user_from_token(access_token, db)
+        current_user = await _get_current_user_from_token(access_token, db)
     except HTTPException:
         raise
     except Exception as e:
@@ -193,6 +398,90 @@ async def get_current_user(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=f"Could not validate credentials: {str(e)}",
         )
+    
+    # The token this request was authenticated with (cookie, refreshed or bearer),
+    # for endpoints that act on the session itself, such as logout
+    request.state.access_token = access_token
+    
+    # Keep the claims token of cookie sessions in step with their roles and
+    # permissions; also issues one to sessions that have none (started before
+    # claims were enabled, or the cookie expired or was dropped)
+    claims_token = request.cookies.get(settings.claims_cookie_name)
+    if claims_signer is not None and cookie_session and (
+        not claims_token
+        or claims_signer.needs_rotation(claims_token, current_user.usuario.id_usuario, current_user.versiones)
+    ):
+        # Written to the response by the refreshed_session_cookies middleware
+        request.state.claims_token = await mint_claims_token(current_user, db)
+    
+    return current_user
+
+
+async def get_tenant_read_db(
+    current_user: CurrentUser = Depends(get_current_user),
+) -> AsyncSession:
+    """
+    Dependency to get a read-only session for the current user's company.
+
+    Uses the read replica, except for a short window after the company wrote
+    (DB_READ_YOUR_WRITES_SECONDS), when it uses the primary. Never commits.
+    """
+    async with read_session_factory(current_user.empresa.id_empresa)() as session:
+        yield session
+
+
+def set_session_cookies(response: Response, tokens: dict) -> None:
+    """Store the access and refresh tokens in HTTP-only cookies."""
+    for key, value in (
+        (settings.cookie_name, tokens["access_token"]),
+        (settings.refresh_cookie_name, tokens["refresh_token"]),
+    ):
+        response.set_cookie(
+            key=key,
+            value=value,
+            httponly=True,
+            secure=settings.cookie_secure,
+            samesite="lax",
+            max_age=settings.session_cookie_max_age_seconds,
+        )
+
+
+async def mint_claims_token(current_user: CurrentUser, db: AsyncSession) -> str:
+    """Signed permission claims token for downstream services (claims tokens must be enabled)."""
+    catalog = await permission_catalog.load(db, current_user.versiones[1])
+    return claims_signer.mint(
+        auth_uid=current_user.usuario.auth_uid,
+        id_usuario=current_user.usuario.id_usuario,
+        id_empresa=current_user.empresa.id_empresa,
+        es_dueno=current_user.usuario.es_dueno,
+        permisos=current_user.permisos,
+        versiones=current_user.versiones,
+        catalog=catalog,
+    )
+
+
+def set_claims_cookie(response: Response, claims_token: str) -> None:
+    """Store the claims token in a cookie, forwarded by the gateway to downstream services."""
+    response.set_cookie(
+        key=settings.claims_cookie_name,
+        value=claims_token,
+        httponly=True,
+        secure=settings.cookie_secure,
+        samesite="lax",
+        # Outlives the token itself: an expiring token is re-minted on the next request here
+        max_age=settings.session_cookie_max_age_seconds,
+    )
+
+
+def clear_session_cookies(response: Response) -> None:
+    """Remove the session cookies (and the claims cookie)."""
+    for key in (settings.cookie_name, settings.refresh_cookie_name, settings.claims_cookie_name):
+        response.delete_cookie(
+            key=key,
+            httponly=True,
+            secure=settings.cookie_secure,
+            samesite="lax",
+        )
 
 
 def require_permission(action: str, resource: str):
@@ -1,9 +1,21 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager, suppress
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 import logging
 
 from app.routers import auth, empresa, usuarios, roles, permisos
 from app.config import get_settings
+from app.database import engine, read_engine
+from app.deps import set_session_cookies, set_claims_cookie
+from app.services.supabase_service import init_supabase_clients, close_supabase_clients
+from app.services.principal_cache import principal_cache
+from app.services.auth_service import session_refresher
+from app.services.auth_user_mirror import reconciliation_loop
+from app.services.token_revocation import revocation_list, revocation_sync_loop
+from app.services.login_throttle import login_throttle
+from app.services.token_service import verified_tokens
+from app.services.claims_token import claims_signer
 
 # Configure logging
 logging.basicConfig(
@@ -13,10 +25,38 @@ logging.basicConfig(
 
 settings = get_settings()
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create shared clients on startup and release them on shutdown."""
+    await init_supabase_clients()
+    reconcile_task = None
+    if settings.auth_mirror_reconcile_interval_seconds > 0:
+        reconcile_task = asyncio.create_task(
+            reconciliation_loop(settings.auth_mirror_reconcile_interval_seconds)
+        )
+    revocation_task = asyncio.create_task(
+        revocation_sync_loop(settings.revocation_sync_interval_seconds)
+    )
+    try:
+        yield
+    finally:
+        for task in (reconcile_task, revocation_task):
+            if task is not None:
+                task.cancel()
+                with suppress(asyncio.CancelledError):
+                    await task
+        await close_supabase_clients()
+        await engine.dispose()
+        if read_engine is not engine:
+            await read_engine.dispose()
+
+
 app = FastAPI(
     title="Auth Service",
     description="Microservice de autenticación con Supabase y PostgreSQL",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # CORS configuration
@@ -28,6 +68,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.middleware("http")
+async def refreshed_session_cookies(request: Request, call_next):
+    """Send the cookies of a session (or claims token) refreshed by get_current_user.
+    
+    Done here because most endpoints return a Response directly, which
+    bypasses headers set on an injected Response by a dependency.
+    """
+    response = await call_next(request)
+    tokens = getattr(request.state, "refreshed_tokens", None)
+    if tokens:
+        set_session_cookies(response, tokens)
+    claims_token = getattr(request.state, "claims_token", None)
+    if claims_token:
+        set_claims_cookie(response, claims_token)
+    return response
+
+
 # Include routers
 app.include_router(auth.router)
 app.include_router(empresa.router)
@@ -49,5 +107,13 @@ async def root():
 @app.get("/health")
 async def health():
     """Health check endpoint."""
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "principal_cache": principal_cache.stats(),
+        "session_refresh": session_refresher.stats(),
+        "token_denylist": revocation_list.stats(),
+        "login_throttle": login_throttle.stats(),
+        "verified_tokens": verified_tokens.stats(),
+        "claims_tokens": claims_signer.stats() if claims_signer else None,
+    }
 
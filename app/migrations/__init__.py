@@ -0,0 +1,8 @@
+"""
+Versioned schema migrations.
+
+Usage:
+    python -m app.migrations upgrade   # apply pending migrations
+    python -m app.migrations status    # list applied / pending migrations
+    python -m app.migrations check     # report missing or invalid indexes
+"""
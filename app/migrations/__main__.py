@@ -0,0 +1,44 @@
+import asyncio
+import logging
+import sys
+
+from app.database import engine
+from app.migrations import runner
+
+
+async def _main(command: str) -> int:
+    try:
+        if command == "upgrade":
+            applied = await runner.upgrade()
+            if not applied:
+                print("Database is up to date")
+            for migration in applied:
+                print(f"Applied {migration.name}")
+            return 0
+        
+        if command == "status":
+            for migration, applied in await runner.status():
+                print(f"[{'x' if applied else ' '}] {migration.name} - {migration.description}")
+            return 0
+        
+        if command == "check":
+            missing, invalid = await runner.check()
+            for table, index in missing:
+                print(f"MISSING  {table}.{index}")
+            for table, index in invalid:
+                print(f"INVALID  {table}.{index}")
+            if missing or invalid:
+                print("Run `python -m app.migrations upgrade` to create them")
+                return 1
+            print("All expected indexes are present")
+            return 0
+    finally:
+        await engine.dispose()
+    
+    print(f"Unknown command: {command}. Use upgrade, status or check.")
+    return 2
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_main(sys.argv[1] if len(sys.argv) > 1 else "upgrade")))
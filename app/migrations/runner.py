@@ -0,0 +1,164 @@
+import importlib
+import logging
+import pkgutil
+from dataclasses import dataclass
+from types import ModuleType
+from typing import List, Set, Tuple
+
+from sqlalchemy import text, UniqueConstraint
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+import app.models  # noqa: F401  (registers every table on Base.metadata)
+from app.database import Base, engine
+from app.migrations import versions
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary key for pg_advisory_lock, so two deploys cannot migrate at once
+_MIGRATION_LOCK_KEY = 0x6D696772
+
+
+@dataclass
+class Migration:
+    version: int
+    name: str
+    description: str
+    statements: List[str]
+    transactional: bool
+
+
+def _load(module: ModuleType, module_name: str) -> Migration:
+    version = int(module_name.split("_", 1)[0])
+    return Migration(
+        version=version,
+        name=module_name,
+        description=getattr(module, "DESCRIPTION", module_name),
+        statements=list(module.STATEMENTS),
+        transactional=getattr(module, "TRANSACTIONAL", True),
+    )
+
+
+def discover_migrations() -> List[Migration]:
+    """All migrations in app/migrations/versions, ordered by version."""
+    migrations = []
+    for module_info in pkgutil.iter_modules(versions.__path__):
+        if not module_info.name[:1].isdigit():
+            continue
+        module = importlib.import_module(f"{versions.__name__}.{module_info.name}")
+        migrations.append(_load(module, module_info.name))
+    migrations.sort(key=lambda migration: migration.version)
+    return migrations
+
+
+def expected_indexes() -> Set[Tuple[str, str]]:
+    """(table, index) pairs declared on the models."""
+    expected = set()
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            expected.add((table.name, index.name))
+        for constraint in table.constraints:
+            if isinstance(constraint, UniqueConstraint) and constraint.name:
+                expected.add((table.name, constraint.name))
+    return expected
+
+
+async def _ensure_version_table(conn: AsyncConnection) -> None:
+    await conn.execute(text(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            nombre VARCHAR(100) NOT NULL,
+            aplicada_en TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+        """
+    ))
+
+
+async def _applied_versions(conn: AsyncConnection) -> Set[int]:
+    result = await conn.execute(text("SELECT version FROM schema_migrations"))
+    return set(result.scalars().all())
+
+
+async def _existing_indexes(conn: AsyncConnection) -> dict:
+    """{(table, index): is_valid} for the current schema."""
+    result = await conn.execute(text(
+        """
+        SELECT t.relname, i.relname, ix.indisvalid
+        FROM pg_index ix
+        JOIN pg_class i ON i.oid = ix.indexrelid
+        JOIN pg_class t ON t.oid = ix.indrelid
+        JOIN pg_namespace n ON n.oid = t.relnamespace
+        WHERE n.nspname = current_schema()
+        """
+    ))
+    return {(table, index): valid for table, index, valid in result.all()}
+
+
+async def _drop_invalid_indexes(conn: AsyncConnection) -> None:
+    """Drop expected indexes left INVALID by an interrupted CREATE INDEX CONCURRENTLY."""
+    existing = await _existing_indexes(conn)
+    for key in sorted(expected_indexes()):
+        if existing.get(key) is False:
+            logger.warning(f"Dropping invalid index {key[1]} on {key[0]} before rebuilding it")
+            await conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{key[1]}"'))
+
+
+async def upgrade() -> List[Migration]:
+    """Apply every pending migration. Returns the ones applied."""
+    applied_now = []
+    async with engine.connect() as conn:
+        # Autocommit: each statement commits on its own, as CONCURRENTLY requires
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": _MIGRATION_LOCK_KEY})
+        try:
+            await _ensure_version_table(conn)
+            applied = await _applied_versions(conn)
+            await _drop_invalid_indexes(conn)
+
+            for migration in discover_migrations():
+                if migration.version in applied:
+                    continue
+                logger.info(f"Applying migration {migration.name}: {migration.description}")
+                if migration.transactional:
+                    async with engine.begin() as tx_conn:
+                        for statement in migration.statements:
+                            await tx_conn.execute(text(statement))
+                        await _record(tx_conn, migration)
+                else:
+                    # Statements are idempotent (IF NOT EXISTS), so a failed run can be retried
+                    for statement in migration.statements:
+                        await conn.execute(text(statement))
+                    await _record(conn, migration)
+                applied_now.append(migration)
+        finally:
+            await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _MIGRATION_LOCK_KEY})
+    return applied_now
+
+
+async def _record(conn: AsyncConnection, migration: Migration) -> None:
+    await conn.execute(
+        text("INSERT INTO schema_migrations (version, nombre) VALUES (:version, :nombre)"),
+        {"version": migration.version, "nombre": migration.name},
+    )
+
+
+async def status() -> List[Tuple[Migration, bool]]:
+    """Every known migration with whether it has been applied."""
+    async with engine.connect() as conn:
+        await _ensure_version_table(conn)
+        applied = await _applied_versions(conn)
+        await conn.commit()
+    return [(migration, migration.version in applied) for migration in discover_migrations()]
+
+
+async def check() -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]:
+    """Expected indexes that are (missing, invalid) in the database."""
+    async with engine.connect() as conn:
+        existing = await _existing_indexes(conn)
+    missing, invalid = [], []
+    for key in sorted(expected_indexes()):
+        if key not in existing:
+            missing.append(key)
+        elif not existing[key]:
+            invalid.append(key)
+    return missing, invalid
@@ -0,0 +1,17 @@
+"""Local mirror of Supabase Auth users (indexed duplicate-email checks)."""
+
+DESCRIPTION = "auth_usuarios mirror table"
+
+# CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+TRANSACTIONAL = False
+
+STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS auth_usuarios (
+        auth_uid UUID PRIMARY KEY,
+        email VARCHAR(255) NOT NULL,
+        fecha_sincronizacion TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+    """,
+    "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ux_auth_usuarios_email_lower ON auth_usuarios (lower(email))",
+]
@@ -0,0 +1,21 @@
+"""Secondary indexes for the hot lookups (login, duplicate checks, tenant lists, joins)."""
+
+DESCRIPTION = "indexes for hot queries"
+
+# CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+TRANSACTIONAL = False
+
+STATEMENTS = [
+    # Login and duplicate-email checks compare lower(email); emails are unique
+    "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ux_usuarios_email_lower ON usuarios (lower(email))",
+    # Tenant listings with keyset pagination
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_usuarios_empresa_id_usuario ON usuarios (empresas_id_empresa, id_usuario)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_roles_empresa_id_rol ON roles (empresas_id_empresa, id_rol)",
+    # Role names are unique per company (create_rol / update_rol checks)
+    "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ux_roles_empresa_nombre ON roles (empresas_id_empresa, nombre)",
+    # One permission per (accion, recurso); ON CONFLICT target in create_rol
+    "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_permisos_accion_recurso ON permisos (accion, recurso)",
+    # Reverse side of the join tables (primary keys lead with the other column)
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_usuarios_roles_rol ON usuarios_roles (roles_id_rol)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_roles_permisos_rol ON roles_permisos (roles_id_rol)",
+]
@@ -0,0 +1,13 @@
+"""Change counters for conditional GETs (ETag / If-None-Match)."""
+
+DESCRIPTION = "versiones_datos counters table"
+
+STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS versiones_datos (
+        clave VARCHAR(40) PRIMARY KEY,
+        version BIGINT NOT NULL DEFAULT 0,
+        fecha_actualizacion TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+    """,
+]
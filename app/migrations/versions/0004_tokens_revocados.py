@@ -0,0 +1,19 @@
+"""Access token denylist (logout revocation)."""
+
+DESCRIPTION = "tokens_revocados denylist table"
+
+# CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+TRANSACTIONAL = False
+
+STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS tokens_revocados (
+        token_hash VARCHAR(64) PRIMARY KEY,
+        auth_uid UUID,
+        expira_en TIMESTAMPTZ NOT NULL,
+        fecha_revocacion TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+    """,
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_tokens_revocados_fecha_revocacion ON tokens_revocados (fecha_revocacion)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_tokens_revocados_expira_en ON tokens_revocados (expira_en)",
+]
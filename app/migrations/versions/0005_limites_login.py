@@ -0,0 +1,15 @@
+"""Shared login attempt counters (LOGIN_THROTTLE_SHARED)."""
+
+DESCRIPTION = "limites_login counters table"
+
+STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS limites_login (
+        clave VARCHAR(320) PRIMARY KEY,
+        ventana_inicio TIMESTAMPTZ NOT NULL DEFAULT now(),
+        intentos INTEGER NOT NULL DEFAULT 0,
+        fallos INTEGER NOT NULL DEFAULT 0,
+        bloqueado_hasta TIMESTAMPTZ
+    )
+    """,
+]
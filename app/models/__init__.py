@@ -2,6 +2,10 @@ from app.models.empresa import Empresa
 from app.models.usuario import Usuario
 from app.models.permiso import Permiso
 from app.models.rol import Rol, RolPermiso, UsuarioRol
+from app.models.auth_usuario import AuthUsuario
+from app.models.version_datos import VersionDatos
+from app.models.token_revocado import TokenRevocado
+from app.models.limite_login import LimiteLogin
 
 __all__ = [
     "Empresa",
@@ -10,5 +14,9 @@ __all__ = [
     "Rol",
     "RolPermiso",
     "UsuarioRol",
+    "AuthUsuario",
+    "VersionDatos",
+    "TokenRevocado",
+    "LimiteLogin",
 ]
 
@@ -0,0 +1,19 @@
+from sqlalchemy import Column, String, DateTime, Index
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class AuthUsuario(Base):
+    """Local mirror of Supabase Auth users, used for indexed email lookups."""
+    __tablename__ = "auth_usuarios"
+
+    auth_uid = Column(UUID(as_uuid=True), primary_key=True)
+    email = Column(String(255), nullable=False)
+    fecha_sincronizacion = Column(
+        DateTime(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now()
+    )
+
+
+# Emails are unique in Supabase Auth regardless of case
+Index("ux_auth_usuarios_email_lower", func.lower(AuthUsuario.email), unique=True)
@@ -0,0 +1,19 @@
+from sqlalchemy import Column, String, Integer, DateTime
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class LimiteLogin(Base):
+    """
+    Login attempt counters shared by every worker (LOGIN_THROTTLE_SHARED).
+
+    One row per key ("ip:<address>" or "email:<normalized email>") with a
+    one-minute attempt window and the consecutive failure count behind the lockout.
+    """
+    __tablename__ = "limites_login"
+
+    clave = Column(String(320), primary_key=True)
+    ventana_inicio = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    intentos = Column(Integer, nullable=False, default=0)
+    fallos = Column(Integer, nullable=False, default=0)
+    bloqueado_hasta = Column(DateTime(timezone=True), nullable=True)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Sequence
+from sqlalchemy import Column, Integer, String, Sequence, Index
 from sqlalchemy.orm import relationship
 from app.database import Base
 
@@ -7,6 +7,10 @@ permisos_seq = Sequence('permisos_seq', start=1)
 
 class Permiso(Base):
     __tablename__ = "permisos"
+    __table_args__ = (
+        # One permission per (accion, recurso); target of ON CONFLICT in create_rol
+        Index("uq_permisos_accion_recurso", "accion", "recurso", unique=True),
+    )
 
     id_permiso = Column(Integer, permisos_seq, primary_key=True, server_default=permisos_seq.next_value())
     accion = Column(String(30), nullable=False)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Sequence
+from sqlalchemy import Column, Integer, String, ForeignKey, Sequence, Index
 from sqlalchemy.orm import relationship
 from app.database import Base
 
@@ -7,6 +7,12 @@ roles_seq = Sequence('roles_seq', start=1)
 
 class Rol(Base):
     __tablename__ = "roles"
+    __table_args__ = (
+        # Tenant listing with keyset pagination (GET /roles)
+        Index("ix_roles_empresa_id_rol", "empresas_id_empresa", "id_rol"),
+        # Role names are unique per company
+        Index("ux_roles_empresa_nombre", "empresas_id_empresa", "nombre", unique=True),
+    )
 
     id_rol = Column(Integer, roles_seq, primary_key=True, server_default=roles_seq.next_value())
     nombre = Column(String(30), nullable=False)
@@ -21,6 +27,10 @@ class Rol(Base):
 
 class RolPermiso(Base):
     __tablename__ = "roles_permisos"
+    __table_args__ = (
+        # The primary key leads with permisos_id_permiso; lookups by role need their own index
+        Index("ix_roles_permisos_rol", "roles_id_rol"),
+    )
 
     permisos_id_permiso = Column(Integer, ForeignKey("permisos.id_permiso"), primary_key=True)
     roles_id_rol = Column(Integer, ForeignKey("roles.id_rol"), primary_key=True)
@@ -32,6 +42,10 @@ class RolPermiso(Base):
 
 class UsuarioRol(Base):
     __tablename__ = "usuarios_roles"
+    __table_args__ = (
+        # The primary key leads with usuarios_id_usuario; lookups by role need their own index
+        Index("ix_usuarios_roles_rol", "roles_id_rol"),
+    )
 
     usuarios_id_usuario = Column(Integer, ForeignKey("usuarios.id_usuario"), primary_key=True)
     roles_id_rol = Column(Integer, ForeignKey("roles.id_rol"), primary_key=True)
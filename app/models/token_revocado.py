@@ -0,0 +1,19 @@
+from sqlalchemy import Column, String, DateTime, Index
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class TokenRevocado(Base):
+    """Access tokens revoked before their expiry (logout). Rows are purged after `expira_en`."""
+    __tablename__ = "tokens_revocados"
+    __table_args__ = (
+        # Incremental sync between workers and purge of expired rows
+        Index("ix_tokens_revocados_fecha_revocacion", "fecha_revocacion"),
+        Index("ix_tokens_revocados_expira_en", "expira_en"),
+    )
+
+    token_hash = Column(String(64), primary_key=True)  # sha256 hex of the JWT
+    auth_uid = Column(UUID(as_uuid=True), nullable=True)
+    expira_en = Column(DateTime(timezone=True), nullable=False)
+    fecha_revocacion = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Sequence
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Sequence, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
@@ -9,6 +9,10 @@ usuarios_seq = Sequence('usuarios_seq', start=1)
 
 class Usuario(Base):
     __tablename__ = "usuarios"
+    __table_args__ = (
+        # Tenant listing with keyset pagination (GET /usuarios)
+        Index("ix_usuarios_empresa_id_usuario", "empresas_id_empresa", "id_usuario"),
+    )
 
     id_usuario = Column(Integer, usuarios_seq, primary_key=True, server_default=usuarios_seq.next_value())
     auth_uid = Column(UUID(as_uuid=True), nullable=False, unique=True)
@@ -24,3 +28,6 @@ class Usuario(Base):
     empresa = relationship("Empresa", back_populates="usuarios")
     roles = relationship("UsuarioRol", back_populates="usuario", cascade="all, delete-orphan")
 
+
+# Login and duplicate-email checks compare lower(email)
+Index("ux_usuarios_email_lower", func.lower(Usuario.email), unique=True)
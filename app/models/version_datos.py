@@ -0,0 +1,20 @@
+from sqlalchemy import Column, String, BigInteger, DateTime
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class VersionDatos(Base):
+    """
+    Change counters behind the ETags of the GET endpoints.
+
+    One row per company ("empresa:<id_empresa>") for its users, roles and
+    company data, and one global row ("permisos") for the permission catalog.
+    Bumped in the same transaction as the write.
+    """
+    __tablename__ = "versiones_datos"
+
+    clave = Column(String(40), primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+    fecha_actualizacion = Column(
+        DateTime(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now()
+    )
@@ -1,17 +1,38 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Response
+from uuid import UUID
+
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_db
-from app.deps import get_current_user, CurrentUser
-from app.services.auth_service import register_owner, login, logout
+from app.database import get_db, get_read_db
+from app.deps import (
+    get_current_user,
+    get_current_user_for_auth_uid,
+    get_principal_for_token,
+    bearer_token,
+    CurrentUser,
+    set_session_cookies,
+    set_claims_cookie,
+    clear_session_cookies,
+    mint_claims_token,
+)
+from app.services.auth_service import register_owner, login, logout, session_refresher
+from app.services.token_revocation import revoke_token
+from app.services.login_throttle import login_throttle, client_ip
+from app.services.claims_token import claims_signer, permission_catalog
 from app.schemas.auth import (
     RegisterOwnerRequest,
     RegisterOwnerResponse,
     LoginRequest,
     LoginResponse,
     UserResponse,
+    AuthorizeRequest,
+    AuthorizeResponse,
+    ClaimsTokenResponse,
 )
 from app.config import get_settings
+from app.serialization import model_response, json_bytes_response
+from app.services.data_version import get_versions, make_etag, not_modified, with_etag
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 settings = get_settings()
@@ -20,7 +41,7 @@ settings = get_settings()
 @router.post("/register-owner", response_model=RegisterOwnerResponse, status_code=status.HTTP_201_CREATED)
 async def register_owner_endpoint(
     request: RegisterOwnerRequest,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_db, scope="function"),
 ):
     """Register a new owner with company."""
     usuario, empresa = await register_owner(request, db)
@@ -39,49 +60,36 @@ async def register_owner_endpoint(
 @router.post("/login", response_model=LoginResponse)
 async def login_endpoint(
     request: LoginRequest,
+    http_request: Request,
     response: Response,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_db, scope="function"),
 ):
     """Login user and set HTTP-only cookie with tokens."""
-    tokens = await login(request.email, request.password)
+    # Shed brute force and credential stuffing with 429 before Supabase or
+    # the database are touched (the request session connects lazily)
+    ip = client_ip(http_request)
+    login_throttle.check(ip, request.email)
+    await login_throttle.check_shared(ip, request.email)
     
-    # Get user info from database
-    from sqlalchemy import select
-    from uuid import UUID
-    from app.models.usuario import Usuario
-    
-    result = await db.execute(
-        select(Usuario).where(Usuario.email == request.email)
-    )
-    usuario = result.scalar_one_or_none()
+    try:
+        tokens = await login(request.email, request.password)
+    except HTTPException as e:
+        if e.status_code == status.HTTP_401_UNAUTHORIZED:
+            await login_throttle.record_failure(request.email)
+        raise
+    await login_throttle.record_success(request.email)
     
-    if not usuario:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found",
-        )
-    
-    # Set HTTP-only cookie with access token
-    # Note: For production, set secure=True, same_site="lax" or "strict"
-    cookie_name = settings.cookie_name
-    response.set_cookie(
-        key=cookie_name,
-        value=tokens["access_token"],
-        httponly=True,
-        secure=False,  # Set to True in production with HTTPS
-        samesite="lax",
-        max_age=60 * 60 * 24 * 7,  # 7 days
-    )
-    
-    # Store refresh token in a separate cookie (optional, or use access token only)
-    # For simplicity, we'll store access_token in the cookie
-    # In production, you might want to store both or use a different strategy
-    
-    # Get current user to return full info
-    from app.deps import _get_current_user_from_token
-    current_user = await _get_current_user_from_token(tokens["access_token"], db)
+    # The sign-in response already identifies the user: resolve the principal
+    # from its id in one query (or the cache), without validating the new token again
+    current_user = await get_current_user_for_auth_uid(UUID(tokens["user_id"]), db)
     user_response = current_user.to_user_response()
     
+    # HTTP-only cookies with both tokens; the refresh token lets get_current_user
+    # renew the access token server-side instead of forcing a new sign-in
+    set_session_cookies(response, tokens)
+    if claims_signer is not None:
+        set_claims_cookie(response, await mint_claims_token(current_user, db))
+    
     return LoginResponse(
         message="Login successful",
         user=user_response,
@@ -90,27 +98,175 @@ async def login_endpoint(
 
 @router.post("/logout")
 async def logout_endpoint(
+    request: Request,
     response: Response,
     current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db, scope="function"),
 ):
-    """Logout user and clear cookie."""
-    cookie_name = settings.cookie_name
+    """Logout user: revoke the access token, end the Supabase session and clear cookies."""
+    # The token get_current_user authenticated: the cookie, the bearer token or,
+    # if the session was refreshed during this request, the new access token
+    current_token = getattr(request.state, "access_token", None)
+    if not current_token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated - no access token to revoke",
+        )
     
-    # Try to get token from request to invalidate
-    # For now, just clear the cookie
-    response.delete_cookie(
-        key=cookie_name,
-        httponly=True,
-        samesite="lax",
-    )
+    # A refreshed session leaves the cookie's old token live as well
+    cookie_token = request.cookies.get(settings.cookie_name)
+    for access_token in {cookie_token, current_token} - {None}:
+        await revoke_token(db, access_token)
+    
+    # Ends the session upstream, revoking its refresh tokens
+    await logout(current_token)
+    
+    refresh_token = request.cookies.get(settings.refresh_cookie_name)
+    if refresh_token:
+        session_refresher.forget(refresh_token)
+    
+    # Do not let the middleware send the refreshed cookies back
+    request.state.refreshed_tokens = None
+    request.state.claims_token = None
+    clear_session_cookies(response)
     
     return {"message": "Logout successful"}
 
 
 @router.get("/me", response_model=UserResponse)
 async def get_me(
+    request: Request,
     current_user: CurrentUser = Depends(get_current_user),
 ):
     """Get current authenticated user information."""
-    return current_user.to_user_response()
+    # The versions were loaded together with the principal, so the ETag always
+    # matches the body, even when the principal comes from the cache
+    etag = make_etag(request, current_user.usuario.auth_uid, *current_user.versiones)
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    
+    return with_etag(model_response(UserResponse, current_user.to_user_response()), etag)
 
+
+
+@router.post("/authorize", response_model=AuthorizeResponse)
+async def authorize(
+    request: AuthorizeRequest,
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    """
+    Decide several (accion, recurso) checks for the caller in one call.
+
+    For downstream services: the caller's cookie or bearer token is resolved
+    once, and `allowed[i]` answers `checks[i]` with the same rules as
+    `require_permission` (owners are allowed everything).
+    """
+    return model_response(
+        AuthorizeResponse,
+        AuthorizeResponse.model_construct(
+            id_usuario=current_user.usuario.id_usuario,
+            id_empresa=current_user.empresa.id_empresa,
+            allowed=current_user.has_permissions(request.checks),
+        ),
+    )
+
+
+@router.get("/verify", status_code=status.HTTP_204_NO_CONTENT, response_class=Response)
+async def verify(request: Request):
+    """
+    Forward auth for reverse proxies (nginx `auth_request`, Traefik `forwardAuth`).
+
+    Answers 204 with the principal in `X-User-Id`, `X-Empresa-Id` and
+    `X-Permissions` ("accion:recurso,...", "*" for owners), 401 without a
+    valid token, or 403 when `X-Required-Permission: accion:recurso` is not
+    granted. `X-Permissions` is left out with FORWARD_AUTH_PERMISSIONS_HEADER
+    off, since long lists overflow proxy header buffers.
+
+    Kept off the usual dependencies: no session unless the principal is not
+    cached, no models and no body. Sessions are not refreshed here, since
+    proxies do not pass the subrequest's cookies on to the client.
+    """
+    access_token = request.cookies.get(settings.cookie_name) or bearer_token(request)
+    if not access_token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+        )
+    
+    principal = await get_principal_for_token(access_token)
+    es_dueno = principal.usuario.es_dueno
+    
+    required = request.headers.get("x-required-permission")
+    if required and not es_dueno:
+        action, _, resource = required.partition(":")
+        if (action.strip(), resource.strip()) not in principal.permission_index:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=f"Permission denied: {required}",
+            )
+    
+    headers = {
+        "X-User-Id": str(principal.usuario.id_usuario),
+        "X-Empresa-Id": str(principal.usuario.empresas_id_empresa),
+    }
+    if settings.forward_auth_permissions_header:
+        headers["X-Permissions"] = "*" if es_dueno else principal.permissions_header
+    return Response(status_code=status.HTTP_204_NO_CONTENT, headers=headers)
+
+
+def _require_claims_signer():
+    if claims_signer is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Claims tokens are not enabled",
+        )
+    return claims_signer
+
+
+@router.post("/claims-token", response_model=ClaimsTokenResponse)
+async def create_claims_token(
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """
+    Mint a signed permission claims token on demand (e.g. for service-to-service calls).
+
+    Browser sessions get it in the claims cookie at login, re-minted
+    automatically when it nears expiry or the user's roles change.
+    """
+    signer = _require_claims_signer()
+    return model_response(
+        ClaimsTokenResponse,
+        ClaimsTokenResponse.model_construct(
+            token=await mint_claims_token(current_user, db),
+            expires_in=signer.ttl_seconds,
+        ),
+    )
+
+
+@router.get("/claims-keys")
+async def get_claims_keys(
+    request: Request,
+    db: AsyncSession = Depends(get_read_db),
+):
+    """
+    Public key set (JWKS) to verify claims tokens, plus the permission catalog
+    that maps the token's bitmask bits (`bit`) to (accion, recurso). A token
+    must be read with the catalog of the version in its `versiones[1]`.
+    """
+    signer = _require_claims_signer()
+    (version_catalogo,) = await get_versions(db, catalog=True)
+    catalog = await permission_catalog.load(db, version_catalogo)
+    etag = make_etag(request, signer.kid, catalog.version)
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    
+    document = {
+        "keys": [signer.public_jwk],
+        # Extra JWK Set members are ignored by standard JWKS clients (RFC 7517)
+        "version_catalogo": catalog.version,
+        "permisos": catalog.permisos,
+    }
+    return with_etag(json_bytes_response(orjson.dumps(document)), etag)
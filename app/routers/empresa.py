@@ -2,10 +2,12 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
-from app.database import get_db
+from app.database import get_db, after_commit, record_tenant_write
 from app.deps import get_current_user, require_permission, CurrentUser
 from app.models.empresa import Empresa
 from app.schemas.empresa import EmpresaResponse, EmpresaUpdate
+from app.services.principal_cache import principal_cache
+from app.services.data_version import bump_empresa_version
 
 router = APIRouter(prefix="/empresa", tags=["empresa"])
 
@@ -13,9 +15,13 @@ router = APIRouter(prefix="/empresa", tags=["empresa"])
 @router.get("", response_model=EmpresaResponse)
 async def get_empresa(
     current_user: CurrentUser = Depends(require_permission("read", "empresas")),
-    db: AsyncSession = Depends(get_db),
 ):
-    """Get current user's company information."""
+    """Get current user's company information.
+    
+    Served from the principal snapshot loaded with the user, without a query.
+    This worker invalidates it on PUT /empresa; other workers may serve it
+    up to PRINCIPAL_CACHE_TTL_SECONDS stale.
+    """
     return EmpresaResponse.model_validate(current_user.empresa)
 
 
@@ -23,18 +29,19 @@ async def get_empresa(
 async def update_empresa(
     empresa_update: EmpresaUpdate,
     current_user: CurrentUser = Depends(require_permission("update", "empresas")),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_db, scope="function"),
 ):
     """Update company information."""
-    empresa = current_user.empresa
+    empresa = await db.get(Empresa, current_user.empresa.id_empresa)
     
     update_data = empresa_update.model_dump(exclude_unset=True)
     
     for field, value in update_data.items():
         setattr(empresa, field, value)
     
-    await db.commit()
-    await db.refresh(empresa)
+    await bump_empresa_version(db, empresa.id_empresa)
+    after_commit(db, record_tenant_write, empresa.id_empresa)
+    after_commit(db, principal_cache.invalidate_empresa, empresa.id_empresa)
     
     return EmpresaResponse.model_validate(empresa)
 
@@ -42,15 +49,17 @@ async def update_empresa(
 @router.delete("", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_empresa(
     current_user: CurrentUser = Depends(require_permission("delete", "empresas")),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_db, scope="function"),
 ):
     """Delete company."""
-    empresa = current_user.empresa
+    empresa = await db.get(Empresa, current_user.empresa.id_empresa)
     
     # Soft delete: set estado to False
     empresa.estado = False
     
-    await db.commit()
+    await bump_empresa_version(db, empresa.id_empresa)
+    after_commit(db, record_tenant_write, empresa.id_empresa)
+    after_commit(db, principal_cache.invalidate_empresa, empresa.id_empresa)
     
     return None
 
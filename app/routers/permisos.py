@@ -1,12 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from typing import List
+from sqlalchemy import select, tuple_
+from typing import Optional
 
-from app.database import get_db
-from app.deps import get_current_user, require_permission, CurrentUser
+from app.database import get_db, after_commit, record_tenant_write
+from app.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, encode_cursor, decode_cursor
+from app.deps import get_current_user, get_tenant_read_db, require_permission, CurrentUser
 from app.models.permiso import Permiso
 from app.schemas.permiso import PermisoCreate, PermisoUpdate, PermisoResponse
+from app.schemas.pagination import Page
+from app.serialization import page_response
+from app.services.principal_cache import principal_cache
+from app.services.data_version import bump_catalog_version, get_versions, make_etag, not_modified, with_etag
 
 router = APIRouter(prefix="/permisos", tags=["permisos"])
 
@@ -15,7 +20,7 @@ router = APIRouter(prefix="/permisos", tags=["permisos"])
 async def create_permiso(
     permiso_create: PermisoCreate,
     current_user: CurrentUser = Depends(require_permission("create", "permisos")),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_db, scope="function"),
 ):
     """Create a new permission."""
     # Check if permission already exists (accion + recurso combination must be unique)
@@ -38,29 +43,62 @@ async def create_permiso(
         recurso=permiso_create.recurso,
     )
     db.add(permiso)
-    await db.commit()
-    await db.refresh(permiso)
+    await db.flush()  # id_permiso is returned by the INSERT
+    await bump_catalog_version(db)
+    after_commit(db, record_tenant_write, current_user.empresa.id_empresa)
     
     return PermisoResponse.model_validate(permiso)
 
 
-@router.get("", response_model=List[PermisoResponse])
+@router.get("", response_model=Page[PermisoResponse])
 async def list_permisos(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    recurso: Optional[str] = Query(None, max_length=30),
+    accion: Optional[str] = Query(None, max_length=30),
     current_user: CurrentUser = Depends(require_permission("read", "permisos")),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_tenant_read_db),
 ):
-    """List all available global permissions."""
-    result = await db.execute(select(Permiso).order_by(Permiso.recurso, Permiso.accion))
-    permisos = result.scalars().all()
-    
-    return [PermisoResponse.model_validate(permiso) for permiso in permisos]
+    """List global permissions ordered by resource and action (keyset pagination)."""
+    # Conditional GET: one counter lookup, and no table queries when unchanged
+    versions = await get_versions(db, catalog=True)
+    etag = make_etag(request, *versions)
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    
+    sort_key = tuple_(Permiso.recurso, Permiso.accion, Permiso.id_permiso)
+    query = (
+        select(Permiso.id_permiso, Permiso.accion, Permiso.recurso)
+        .order_by(Permiso.recurso, Permiso.accion, Permiso.id_permiso)
+        .limit(limit + 1)
+    )
+    if cursor:
+        last_key = decode_cursor(cursor, str, str, int)
+        query = query.where(sort_key > tuple_(*last_key))
+    if recurso is not None:
+        query = query.where(Permiso.recurso == recurso)
+    if accion is not None:
+        query = query.where(Permiso.accion == accion)
+    
+    result = await db.execute(query)
+    permisos = result.mappings().all()
+    
+    next_cursor = None
+    if len(permisos) > limit:
+        permisos = permisos[:limit]
+        last = permisos[-1]
+        next_cursor = encode_cursor(last["recurso"], last["accion"], last["id_permiso"])
+    
+    return with_etag(page_response([dict(permiso) for permiso in permisos], next_cursor), etag)
 
 
 @router.get("/{permiso_id}", response_model=PermisoResponse)
 async def get_permiso(
     permiso_id: int,
     current_user: CurrentUser = Depends(require_permission("read", "permisos")),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_tenant_read_db),
 ):
     """Get a specific permission by ID."""
     result = await db.execute(
@@ -82,7 +120,7 @@ async def update_permiso(
     permiso_id: int,
     permiso_update: PermisoUpdate,
     current_user: CurrentUser = Depends(require_permission("update", "permisos")),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_db, scope="function"),
 ):
     """Update a permission."""
     result = await db.execute(
@@ -123,8 +161,11 @@ async def update_permiso(
     for field, value in update_data.items():
         setattr(permiso, field, value)
     
-    await db.commit()
-    await db.refresh(permiso)
+    await db.flush()
+    await bump_catalog_version(db)
+    after_commit(db, record_tenant_write, current_user.empresa.id_empresa)
+    # Permissions are global: any cached principal may hold this one
+    after_commit(db, principal_cache.clear)
     
     return PermisoResponse.model_validate(permiso)
 
@@ -133,7 +174,7 @@ async def update_permiso(
 async def delete_permiso(
     permiso_id: int,
     current_user: CurrentUser = Depends(require_permission("delete", "permisos")),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_db, scope="function"),
 ):
     """Delete a permission."""
     result = await db.execute(
@@ -163,7 +204,8 @@ async def delete_permiso(
     # Delete permission
     from sqlalchemy import delete
     await db.execute(delete(Permiso).where(Permiso.id_permiso == permiso_id))
-    await db.commit()
+    await bump_catalog_version(db)
+    after_commit(db, record_tenant_write, current_user.empresa.id_empresa)
     
     return None
 
@@ -1,13 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from typing import List
+from sqlalchemy import select, delete, func, literal_column, tuple_
+from sqlalchemy.dialects.postgresql import JSONB, insert
+from typing import Optional
 
-from app.database import get_db
-from app.deps import get_current_user, require_permission, CurrentUser
-from app.models.rol import Rol, RolPermiso
+from app.database import get_db, after_commit, record_tenant_write
+from app.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, encode_cursor, decode_cursor, escape_like
+from app.deps import get_current_user, get_tenant_read_db, require_permission, CurrentUser
+from app.models.rol import Rol, RolPermiso, UsuarioRol
 from app.models.permiso import Permiso
 from app.schemas.rol import RolCreate, RolUpdate, RolResponse
+from app.schemas.pagination import Page
+from app.serialization import page_response
+from app.services.principal_cache import principal_cache
+from app.services.data_version import (
+    bump_empresa_version,
+    bump_catalog_version,
+    get_versions,
+    make_etag,
+    not_modified,
+    with_etag,
+)
 
 router = APIRouter(prefix="/roles", tags=["roles"])
 
@@ -16,7 +29,7 @@ router = APIRouter(prefix="/roles", tags=["roles"])
 async def create_rol(
     rol_create: RolCreate,
     current_user: CurrentUser = Depends(require_permission("create", "roles")),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_db, scope="function"),
 ):
     """Create a new role for the company.
     
@@ -38,31 +51,38 @@ async def create_rol(
             detail="Role name already exists in company",
         )
     
-    # Create new permissions if provided
+    # Create new permissions if provided: one INSERT ... ON CONFLICT DO NOTHING
+    # RETURNING for the new ones, one SELECT for those that already existed
     permisos_nuevos_ids = []
-    if rol_create.permisos_nuevos:
-        for permiso_data in rol_create.permisos_nuevos:
-            # Check if permission already exists
+    pares_nuevos = {(p.accion, p.recurso) for p in (rol_create.permisos_nuevos or [])}
+    if pares_nuevos:
+        inserted_result = await db.execute(
+            insert(Permiso)
+            .values([{"accion": accion, "recurso": recurso} for accion, recurso in pares_nuevos])
+            .on_conflict_do_nothing(index_elements=[Permiso.accion, Permiso.recurso])
+            .returning(Permiso.id_permiso, Permiso.accion, Permiso.recurso)
+        )
+        ids_por_par = {
+            (accion, recurso): id_permiso
+            for id_permiso, accion, recurso in inserted_result.all()
+        }
+        if ids_por_par:
+            # New entries in the global permission catalog
+            await bump_catalog_version(db)
+        
+        pares_existentes = pares_nuevos - ids_por_par.keys()
+        if pares_existentes:
             existing_result = await db.execute(
-                select(Permiso).where(
-                    Permiso.accion == permiso_data.accion,
-                    Permiso.recurso == permiso_data.recurso,
+                select(Permiso.id_permiso, Permiso.accion, Permiso.recurso).where(
+                    tuple_(Permiso.accion, Permiso.recurso).in_(pares_existentes)
                 )
             )
-            existing_permiso = existing_result.scalar_one_or_none()
-            
-            if existing_permiso:
-                # Use existing permission
-                permisos_nuevos_ids.append(existing_permiso.id_permiso)
-            else:
-                # Create new permission
-                nuevo_permiso = Permiso(
-                    accion=permiso_data.accion,
-                    recurso=permiso_data.recurso,
-                )
-                db.add(nuevo_permiso)
-                await db.flush()
-                permisos_nuevos_ids.append(nuevo_permiso.id_permiso)
+            ids_por_par.update(
+                ((accion, recurso), id_permiso)
+                for id_permiso, accion, recurso in existing_result.all()
+            )
+        
+        permisos_nuevos_ids = list(ids_por_par.values())
     
     # Combine existing permission IDs with newly created ones
     todos_los_permisos_ids = list(set((rol_create.permisos_ids or []) + permisos_nuevos_ids))
@@ -107,16 +127,12 @@ async def create_rol(
             )
             db.add(rol_permiso)
     
-    await db.commit()
-    await db.refresh(rol)
+    await db.flush()
+    await bump_empresa_version(db, current_user.empresa.id_empresa)
+    after_commit(db, record_tenant_write, current_user.empresa.id_empresa)
     
-    # Get permissions for response
-    permisos_result = await db.execute(
-        select(Permiso)
-        .join(RolPermiso)
-        .where(RolPermiso.roles_id_rol == rol.id_rol)
-    )
-    rol_permisos = permisos_result.scalars().all()
+    # The validated permissions are exactly the role's permissions
+    rol_permisos = permisos
     
     return RolResponse(
         id_rol=rol.id_rol,
@@ -134,47 +150,78 @@ async def create_rol(
     )
 
 
-@router.get("", response_model=List[RolResponse])
+@router.get("", response_model=Page[RolResponse])
 async def list_roles(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    nombre: Optional[str] = Query(None, max_length=30, description="Name prefix"),
     current_user: CurrentUser = Depends(require_permission("read", "roles")),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_tenant_read_db),
 ):
-    """List all roles in current user's company."""
-    result = await db.execute(
-        select(Rol).where(
-            Rol.empresas_id_empresa == current_user.empresa.id_empresa
+    """List roles in current user's company (keyset pagination on id_rol)."""
+    # Conditional GET: one counter lookup, and no table queries when unchanged
+    versions = await get_versions(db, current_user.empresa.id_empresa, catalog=True)
+    etag = make_etag(request, current_user.empresa.id_empresa, *versions)
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    
+    # One statement: each role with its permissions (as a JSON array) and user count
+    permisos_json = (
+        select(
+            func.coalesce(
+                func.jsonb_agg(
+                    func.jsonb_build_object(
+                        "id_permiso", Permiso.id_permiso,
+                        "accion", Permiso.accion,
+                        "recurso", Permiso.recurso,
+                    )
+                ),
+                literal_column("'[]'::jsonb"),
+                type_=JSONB,
+            )
         )
+        .select_from(RolPermiso)
+        .join(Permiso, Permiso.id_permiso == RolPermiso.permisos_id_permiso)
+        .where(RolPermiso.roles_id_rol == Rol.id_rol)
+        .scalar_subquery()
+    )
+    usuarios_count = (
+        select(func.count())
+        .select_from(UsuarioRol)
+        .where(UsuarioRol.roles_id_rol == Rol.id_rol)
+        .scalar_subquery()
     )
-    roles = result.scalars().all()
     
-    # Get permissions for each role
-    roles_response = []
-    for rol in roles:
-        permisos_result = await db.execute(
-            select(Permiso)
-            .join(RolPermiso)
-            .where(RolPermiso.roles_id_rol == rol.id_rol)
-        )
-        permisos = permisos_result.scalars().all()
-        
-        roles_response.append(
-            RolResponse(
-                id_rol=rol.id_rol,
-                nombre=rol.nombre,
-                descripcion=rol.descripcion,
-                empresas_id_empresa=rol.empresas_id_empresa,
-                permisos=[
-                    {
-                        "id_permiso": p.id_permiso,
-                        "accion": p.accion,
-                        "recurso": p.recurso,
-                    }
-                    for p in permisos
-                ],
-            )
+    query = (
+        select(
+            Rol.id_rol,
+            Rol.nombre,
+            Rol.descripcion,
+            Rol.empresas_id_empresa,
+            permisos_json.label("permisos"),
+            usuarios_count.label("usuarios_count"),
         )
+        .where(Rol.empresas_id_empresa == current_user.empresa.id_empresa)
+        .order_by(Rol.id_rol)
+        .limit(limit + 1)
+    )
+    if cursor:
+        (last_id,) = decode_cursor(cursor, int)
+        query = query.where(Rol.id_rol > last_id)
+    if nombre:
+        query = query.where(Rol.nombre.ilike(f"{escape_like(nombre)}%"))
     
-    return roles_response
+    # Plain rows (permissions already decoded from JSONB) go straight to the JSON encoder
+    rows = (await db.execute(query)).mappings().all()
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["id_rol"])
+    
+    return with_etag(page_response([dict(row) for row in rows], next_cursor), etag)
 
 
 @router.patch("/{rol_id}", response_model=RolResponse)
@@ -182,7 +229,7 @@ async def update_rol(
     rol_id: int,
     rol_update: RolUpdate,
     current_user: CurrentUser = Depends(require_permission("update", "roles")),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_db, scope="function"),
 ):
     """Update role information."""
     result = await db.execute(
@@ -204,60 +251,98 @@ async def update_rol(
     # Handle permissions update separately
     permisos_ids = update_data.pop("permisos_ids", None)
     
+    # Role names are unique per company
+    if "nombre" in update_data and update_data["nombre"] != rol.nombre:
+        duplicate_result = await db.execute(
+            select(Rol.id_rol).where(
+                Rol.nombre == update_data["nombre"],
+                Rol.empresas_id_empresa == current_user.empresa.id_empresa,
+                Rol.id_rol != rol_id,
+            )
+        )
+        if duplicate_result.scalar_one_or_none() is not None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Role name already exists in company",
+            )
+    
     # Update role fields
     for field, value in update_data.items():
         setattr(rol, field, value)
     
     # Update permissions if provided
     if permisos_ids is not None:
+        puede_actualizar, puede_eliminar, puede_crear = current_user.has_permissions([
+            ("update", "roles_permisos"),
+            ("delete", "roles_permisos"),
+            ("create", "roles_permisos"),
+        ])
+        
         # Verify user has permission to manage roles_permisos
-        if not current_user.has_permission("update", "roles_permisos"):
+        if not puede_actualizar:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Permission denied: update on roles_permisos (required to modify permissions of roles)",
             )
         
         # Remove existing permissions (requires delete permission on roles_permisos)
-        if not current_user.has_permission("delete", "roles_permisos"):
+        if not puede_eliminar:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Permission denied: delete on roles_permisos (required to remove permissions from roles)",
             )
         
-        from sqlalchemy import delete
-        await db.execute(
-            delete(RolPermiso).where(RolPermiso.roles_id_rol == rol.id_rol)
-        )
+        # Duplicated ids in the request are not an error
+        desired_ids = set(permisos_ids)
         
-        # Add new permissions
-        if permisos_ids:
+        if desired_ids:
             permisos_result = await db.execute(
-                select(Permiso).where(Permiso.id_permiso.in_(permisos_ids))
+                select(Permiso.id_permiso).where(Permiso.id_permiso.in_(desired_ids))
             )
-            permisos = permisos_result.scalars().all()
-            
-            if len(permisos) != len(permisos_ids):
+            if len(permisos_result.scalars().all()) != len(desired_ids):
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail="Some permissions not found",
                 )
             
             # Verify user has permission to create roles_permisos
-            if not current_user.has_permission("create", "roles_permisos"):
+            if not puede_crear:
                 raise HTTPException(
                     status_code=status.HTTP_403_FORBIDDEN,
                     detail="Permission denied: create on roles_permisos (required to assign permissions to roles)",
                 )
-            
-            for permiso in permisos:
-                rol_permiso = RolPermiso(
-                    permisos_id_permiso=permiso.id_permiso,
-                    roles_id_rol=rol.id_rol,
+        
+        # Apply only the difference: one DELETE and one multi-row upsert
+        current_result = await db.execute(
+            select(RolPermiso.permisos_id_permiso).where(RolPermiso.roles_id_rol == rol.id_rol)
+        )
+        current_ids = set(current_result.scalars().all())
+        removed_ids = current_ids - desired_ids
+        added_ids = desired_ids - current_ids
+        
+        if removed_ids:
+            await db.execute(
+                delete(RolPermiso).where(
+                    RolPermiso.roles_id_rol == rol.id_rol,
+                    RolPermiso.permisos_id_permiso.in_(removed_ids),
                 )
-                db.add(rol_permiso)
+            )
+        
+        if added_ids:
+            await db.execute(
+                insert(RolPermiso)
+                .values([
+                    {"permisos_id_permiso": permiso_id, "roles_id_rol": rol.id_rol}
+                    for permiso_id in added_ids
+                ])
+                .on_conflict_do_nothing()
+            )
     
-    await db.commit()
-    await db.refresh(rol)
+    await db.flush()
+    await bump_empresa_version(db, current_user.empresa.id_empresa)
+    after_commit(db, record_tenant_write, current_user.empresa.id_empresa)
+    # Every user holding this role sees the change
+    after_commit(db, principal_cache.invalidate_empresa, rol.empresas_id_empresa)
     
     # Get permissions for response
     permisos_result = await db.execute(
@@ -287,7 +372,7 @@ async def update_rol(
 async def delete_rol(
     rol_id: int,
     current_user: CurrentUser = Depends(require_permission("delete", "roles")),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_db, scope="function"),
 ):
     """Delete role."""
     result = await db.execute(
@@ -305,9 +390,10 @@ async def delete_rol(
         )
     
     # Cascade delete will handle roles_permisos and usuarios_roles
-    from sqlalchemy import delete
     await db.execute(delete(Rol).where(Rol.id_rol == rol.id_rol))
-    await db.commit()
+    await bump_empresa_version(db, current_user.empresa.id_empresa)
+    after_commit(db, record_tenant_write, current_user.empresa.id_empresa)
+    after_commit(db, principal_cache.invalidate_empresa, current_user.empresa.id_empresa)
     
     return None
 
@@ -1,33 +1,45 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
-from typing import List
+from sqlalchemy import select, delete, func
+from sqlalchemy.dialects.postgresql import insert
+from typing import Optional
 from uuid import UUID
 
-from app.database import get_db
-from app.deps import get_current_user, require_permission, require_owner, CurrentUser
+from app.database import get_db, after_commit, record_tenant_write
+from app.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, encode_cursor, decode_cursor, escape_like
+from app.deps import get_current_user, get_tenant_read_db, require_permission, require_owner, CurrentUser
 from app.models.usuario import Usuario
 from app.models.empresa import Empresa
 from app.models.rol import Rol, UsuarioRol
-from app.schemas.usuario import UsuarioCreate, UsuarioUpdate, UsuarioResponse
+from app.schemas.usuario import UsuarioCreate, UsuarioUpdate, UsuarioResponse, UsuarioBulkResponse
+from app.schemas.pagination import Page
+from app.serialization import page_response
 from app.schemas.usuario_rol import UsuarioRolAssign, UsuarioWithRolesResponse, RolInfo
-from app.services.supabase_service import get_supabase_auth_client
+from app.services.supabase_service import get_supabase_client
 from app.services.auth_service import register_owner
+from app.services.principal_cache import principal_cache
+from app.services.data_version import bump_empresa_version, get_versions, make_etag, not_modified, with_etag
+from app.services.auth_user_mirror import find_auth_user_by_email, upsert_auth_user
+from app.services.bulk_import_service import parse_import_file, import_usuarios
 
 router = APIRouter(prefix="/usuarios", tags=["usuarios"])
 
+# Columns of UsuarioResponse, in order
+_USUARIO_RESPONSE_COLUMNS = [
+    getattr(Usuario, field) for field in UsuarioResponse.model_fields
+]
+
 
 @router.post("", response_model=UsuarioResponse, status_code=status.HTTP_201_CREATED)
 async def create_usuario(
     usuario_create: UsuarioCreate,
     current_user: CurrentUser = Depends(require_permission("create", "usuarios")),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_db, scope="function"),
 ):
     """Create a new employee user."""
     # Check if email already exists in database
     result = await db.execute(
-        select(Usuario).where(Usuario.email == usuario_create.email)
+        select(Usuario).where(func.lower(Usuario.email) == usuario_create.email.lower())
     )
     existing_user = result.scalar_one_or_none()
     if existing_user:
@@ -36,26 +48,18 @@ async def create_usuario(
             detail="Email already registered in database",
         )
     
-    # Check if email already exists in Supabase Auth
-    supabase = get_supabase_auth_client()
-    try:
-        # Try to get user by email from Supabase
-        auth_users = supabase.auth.admin.list_users()
-        for user in auth_users.users:
-            if user.email == usuario_create.email:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Email already registered in authentication service",
-                )
-    except HTTPException:
-        raise
-    except Exception:
-        # If we can't check, continue (Supabase will return error if exists)
-        pass
+    # Check if email already exists in Supabase Auth (local mirror, indexed lookup)
+    if await find_auth_user_by_email(db, usuario_create.email):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email already registered in authentication service",
+        )
+    
+    supabase = get_supabase_client()
     
     # Create user in Supabase Auth
     try:
-        auth_response = supabase.auth.admin.create_user({
+        auth_response = await supabase.auth.admin.create_user({
             "email": usuario_create.email,
             "password": usuario_create.password,
             "email_confirm": True,
@@ -75,6 +79,8 @@ async def create_usuario(
             detail=f"Failed to create authentication user: {str(e)}",
         )
     
+    await upsert_auth_user(db, auth_uid, usuario_create.email)
+    
     # Create usuario in database
     usuario = Usuario(
         auth_uid=auth_uid,
@@ -86,27 +92,96 @@ async def create_usuario(
         empresas_id_empresa=current_user.empresa.id_empresa,
     )
     db.add(usuario)
-    await db.flush()
-    await db.commit()
-    await db.refresh(usuario)
+    await db.flush()  # id_usuario and fecha_creacion are returned by the INSERT
+    await bump_empresa_version(db, current_user.empresa.id_empresa)
+    after_commit(db, record_tenant_write, current_user.empresa.id_empresa)
     
     return UsuarioResponse.model_validate(usuario)
 
 
-@router.get("", response_model=List[UsuarioResponse])
+@router.post("/bulk", response_model=UsuarioBulkResponse)
+async def bulk_create_usuarios(
+    request: Request,
+    current_user: CurrentUser = Depends(require_permission("create", "usuarios")),
+    db: AsyncSession = Depends(get_db, scope="function"),
+):
+    """Import employees from a CSV (with header) or NDJSON body.
+    
+    Columns/keys: nombre, apellido, email, password and optionally roles_ids
+    (a list in NDJSON, "1;2" in CSV). Assigning roles requires permission
+    'create' on 'usuarios_roles'. Returns one result per row.
+    """
+    raw_rows = parse_import_file(request.headers.get("content-type", ""), await request.body())
+    
+    if any(isinstance(raw, dict) and raw.get("roles_ids") for raw in raw_rows):
+        if not current_user.has_permission("create", "usuarios_roles"):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Permission denied: create on usuarios_roles (required to assign roles on import)",
+            )
+    
+    resultados = await import_usuarios(raw_rows, current_user.empresa.id_empresa, db)
+    creados = sum(1 for resultado in resultados if resultado.creado)
+    if creados:
+        await bump_empresa_version(db, current_user.empresa.id_empresa)
+        after_commit(db, record_tenant_write, current_user.empresa.id_empresa)
+    
+    return UsuarioBulkResponse(
+        total=len(resultados),
+        creados=creados,
+        fallidos=len(resultados) - creados,
+        resultados=resultados,
+    )
+
+
+@router.get("", response_model=Page[UsuarioResponse])
 async def list_usuarios(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    estado: Optional[bool] = None,
+    es_dueno: Optional[bool] = None,  # true: only owners, false: only employees
+    incluir_duenos: bool = False,  # Without es_dueno: employees only, unless true
+    nombre: Optional[str] = Query(None, max_length=30, description="Name prefix"),
     current_user: CurrentUser = Depends(require_permission("read", "usuarios")),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_tenant_read_db),
 ):
-    """List all employees in current user's company."""
-    result = await db.execute(
-        select(Usuario)
+    """List employees in current user's company (keyset pagination on id_usuario)."""
+    # Conditional GET: one counter lookup, and no table queries when unchanged
+    versions = await get_versions(db, current_user.empresa.id_empresa)
+    etag = make_etag(request, current_user.empresa.id_empresa, *versions)
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    
+    # Plain columns instead of ORM entities: rows go straight to the JSON encoder
+    query = (
+        select(*_USUARIO_RESPONSE_COLUMNS)
         .where(Usuario.empresas_id_empresa == current_user.empresa.id_empresa)
-        .where(Usuario.es_dueno == False)  # Only employees, not owners
+        .order_by(Usuario.id_usuario)
+        .limit(limit + 1)
     )
-    usuarios = result.scalars().all()
-    
-    return [UsuarioResponse.model_validate(usuario) for usuario in usuarios]
+    if cursor:
+        (last_id,) = decode_cursor(cursor, int)
+        query = query.where(Usuario.id_usuario > last_id)
+    if estado is not None:
+        query = query.where(Usuario.estado == estado)
+    if es_dueno is not None:
+        query = query.where(Usuario.es_dueno == es_dueno)
+    elif not incluir_duenos:
+        query = query.where(Usuario.es_dueno == False)  # Only employees, not owners
+    if nombre:
+        query = query.where(Usuario.nombre.ilike(f"{escape_like(nombre)}%"))
+    
+    result = await db.execute(query)
+    usuarios = result.mappings().all()
+    
+    next_cursor = None
+    if len(usuarios) > limit:
+        usuarios = usuarios[:limit]
+        next_cursor = encode_cursor(usuarios[-1]["id_usuario"])
+    
+    return with_etag(page_response([dict(usuario) for usuario in usuarios], next_cursor), etag)
 
 
 @router.patch("/{usuario_id}", response_model=UsuarioResponse)
@@ -114,7 +189,7 @@ async def update_usuario(
     usuario_id: int,
     usuario_update: UsuarioUpdate,
     current_user: CurrentUser = Depends(require_permission("update", "usuarios")),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_db, scope="function"),
 ):
     """Update employee information."""
     result = await db.execute(
@@ -141,7 +216,7 @@ async def update_usuario(
         # Check if new email already exists in database
         email_check = await db.execute(
             select(Usuario).where(
-                Usuario.email == new_email,
+                func.lower(Usuario.email) == new_email.lower(),
                 Usuario.id_usuario != usuario_id
             )
         )
@@ -152,25 +227,18 @@ async def update_usuario(
                 detail="Email already registered in database",
             )
         
-        # Check if email already exists in Supabase Auth
-        supabase = get_supabase_auth_client()
-        try:
-            auth_users = supabase.auth.admin.list_users()
-            for user in auth_users.users:
-                if user.email == new_email and str(user.id) != str(usuario.auth_uid):
-                    raise HTTPException(
-                        status_code=status.HTTP_400_BAD_REQUEST,
-                        detail="Email already registered in authentication service",
-                    )
-        except HTTPException:
-            raise
-        except Exception:
-            # If we can't check, continue (Supabase will return error if exists)
-            pass
+        # Check if email already exists in Supabase Auth (local mirror, indexed lookup)
+        if await find_auth_user_by_email(db, new_email, exclude_auth_uid=usuario.auth_uid):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Email already registered in authentication service",
+            )
+        
+        supabase = get_supabase_client()
         
         # Update email in Supabase Auth
         try:
-            supabase.auth.admin.update_user_by_id(
+            await supabase.auth.admin.update_user_by_id(
                 str(usuario.auth_uid),
                 {"email": new_email}
             )
@@ -179,12 +247,16 @@ async def update_usuario(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"Failed to update email in authentication service: {str(e)}",
             )
+        
+        await upsert_auth_user(db, usuario.auth_uid, new_email)
     
     for field, value in update_data.items():
         setattr(usuario, field, value)
     
-    await db.commit()
-    await db.refresh(usuario)
+    await db.flush()
+    await bump_empresa_version(db, current_user.empresa.id_empresa)
+    after_commit(db, record_tenant_write, current_user.empresa.id_empresa)
+    after_commit(db, principal_cache.invalidate, usuario.auth_uid)
     
     return UsuarioResponse.model_validate(usuario)
 
@@ -193,7 +265,7 @@ async def update_usuario(
 async def delete_usuario(
     usuario_id: int,
     current_user: CurrentUser = Depends(require_permission("delete", "usuarios")),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_db, scope="function"),
 ):
     """Delete employee (soft delete)."""
     result = await db.execute(
@@ -219,7 +291,9 @@ async def delete_usuario(
     # Soft delete: set estado to False
     usuario.estado = False
     
-    await db.commit()
+    await bump_empresa_version(db, current_user.empresa.id_empresa)
+    after_commit(db, record_tenant_write, current_user.empresa.id_empresa)
+    after_commit(db, principal_cache.invalidate, usuario.auth_uid)
     
     return None
 
@@ -229,17 +303,16 @@ async def assign_roles_to_usuario(
     usuario_id: int,
     roles_assign: UsuarioRolAssign,
     current_user: CurrentUser = Depends(require_permission("create", "usuarios_roles")),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_db, scope="function"),
 ):
     """Assign roles to a user.
     
     Requires permission 'create' on 'usuarios_roles'.
+    The given list replaces the user's roles; only the difference is written.
     """
     # Get user
     result = await db.execute(
-        select(Usuario)
-        .options(selectinload(Usuario.roles))
-        .where(
+        select(Usuario).where(
             Usuario.id_usuario == usuario_id,
             Usuario.empresas_id_empresa == current_user.empresa.id_empresa,
         )
@@ -253,20 +326,19 @@ async def assign_roles_to_usuario(
         )
     
     # Validate all roles exist and belong to the same company
-    unique_role_ids = []
-    if roles_assign.roles_ids:
-        # Remove duplicates from the list
-        unique_role_ids = list(set(roles_assign.roles_ids))
-        
+    # Remove duplicates from the list
+    desired_role_ids = set(roles_assign.roles_ids)
+    roles = []
+    if desired_role_ids:
         roles_result = await db.execute(
             select(Rol).where(
-                Rol.id_rol.in_(unique_role_ids),
+                Rol.id_rol.in_(desired_role_ids),
                 Rol.empresas_id_empresa == current_user.empresa.id_empresa,
             )
         )
         roles = roles_result.scalars().all()
         found_role_ids = {rol.id_rol for rol in roles}
-        missing_role_ids = set(unique_role_ids) - found_role_ids
+        missing_role_ids = desired_role_ids - found_role_ids
         
         if missing_role_ids:
             raise HTTPException(
@@ -274,35 +346,38 @@ async def assign_roles_to_usuario(
                 detail=f"Roles not found or do not belong to your company: {list(missing_role_ids)}",
             )
     
-    # Remove existing role assignments
-    existing_roles_result = await db.execute(
-        select(UsuarioRol).where(UsuarioRol.usuarios_id_usuario == usuario_id)
+    # Diff against the current assignments
+    current_result = await db.execute(
+        select(UsuarioRol.roles_id_rol).where(UsuarioRol.usuarios_id_usuario == usuario_id)
     )
-    existing_roles = existing_roles_result.scalars().all()
-    for usuario_rol in existing_roles:
-        await db.delete(usuario_rol)
-    
-    # Add new role assignments (use unique_role_ids if validation passed)
-    role_ids_to_assign = unique_role_ids if roles_assign.roles_ids else []
-    if role_ids_to_assign:
-        for rol_id in role_ids_to_assign:
-            usuario_rol = UsuarioRol(
-                usuarios_id_usuario=usuario_id,
-                roles_id_rol=rol_id,
+    current_role_ids = set(current_result.scalars().all())
+    removed_role_ids = current_role_ids - desired_role_ids
+    added_role_ids = desired_role_ids - current_role_ids
+    
+    if removed_role_ids:
+        await db.execute(
+            delete(UsuarioRol).where(
+                UsuarioRol.usuarios_id_usuario == usuario_id,
+                UsuarioRol.roles_id_rol.in_(removed_role_ids),
             )
-            db.add(usuario_rol)
+        )
     
-    await db.commit()
-    await db.refresh(usuario)
+    if added_role_ids:
+        await db.execute(
+            insert(UsuarioRol)
+            .values([
+                {"usuarios_id_usuario": usuario_id, "roles_id_rol": rol_id}
+                for rol_id in added_role_ids
+            ])
+            .on_conflict_do_nothing()
+        )
     
-    # Get user roles for response
-    roles_result = await db.execute(
-        select(Rol)
-        .join(UsuarioRol)
-        .where(UsuarioRol.usuarios_id_usuario == usuario_id)
-    )
-    user_roles = roles_result.scalars().all()
+    if removed_role_ids or added_role_ids:
+        await bump_empresa_version(db, current_user.empresa.id_empresa)
+        after_commit(db, record_tenant_write, current_user.empresa.id_empresa)
+        after_commit(db, principal_cache.invalidate, usuario.auth_uid)
     
+    # The validated roles are exactly the resulting assignment
     return UsuarioWithRolesResponse(
         id_usuario=usuario.id_usuario,
         nombre=usuario.nombre,
@@ -316,7 +391,7 @@ async def assign_roles_to_usuario(
                 nombre=rol.nombre,
                 descripcion=rol.descripcion,
             )
-            for rol in user_roles
+            for rol in roles
         ],
     )
 
@@ -325,7 +400,7 @@ async def assign_roles_to_usuario(
 async def get_usuario_roles(
     usuario_id: int,
     current_user: CurrentUser = Depends(require_permission("read", "usuarios_roles")),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_tenant_read_db),
 ):
     """Get roles assigned to a user."""
     # Get user
@@ -374,7 +449,7 @@ async def remove_role_from_usuario(
     usuario_id: int,
     rol_id: int,
     current_user: CurrentUser = Depends(require_permission("delete", "usuarios_roles")),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_db, scope="function"),
 ):
     """Remove a role from a user."""
     # Verify user exists and belongs to company
@@ -422,14 +497,15 @@ async def remove_role_from_usuario(
             detail="User does not have this role assigned",
         )
     
-    from sqlalchemy import delete
     await db.execute(
         delete(UsuarioRol).where(
             UsuarioRol.usuarios_id_usuario == usuario_id,
             UsuarioRol.roles_id_rol == rol_id,
         )
     )
-    await db.commit()
+    await bump_empresa_version(db, current_user.empresa.id_empresa)
+    after_commit(db, record_tenant_write, current_user.empresa.id_empresa)
+    after_commit(db, principal_cache.invalidate, usuario.auth_uid)
     
     return None
 
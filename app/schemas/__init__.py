@@ -13,6 +13,9 @@ from app.schemas.usuario import (
     UsuarioCreate,
     UsuarioUpdate,
     UsuarioResponse,
+    UsuarioBulkRow,
+    UsuarioBulkResult,
+    UsuarioBulkResponse,
 )
 from app.schemas.rol import (
     RolCreate,
@@ -24,6 +27,7 @@ from app.schemas.permiso import (
     PermisoUpdate,
     PermisoResponse,
 )
+from app.schemas.pagination import Page
 from app.schemas.usuario_rol import (
     UsuarioRolAssign,
     UsuarioWithRolesResponse,
@@ -40,6 +44,9 @@ __all__ = [
     "UsuarioCreate",
     "UsuarioUpdate",
     "UsuarioResponse",
+    "UsuarioBulkRow",
+    "UsuarioBulkResult",
+    "UsuarioBulkResponse",
     "RolCreate",
     "RolUpdate",
     "RolResponse",
@@ -48,5 +55,6 @@ __all__ = [
     "PermisoResponse",
     "UsuarioRolAssign",
     "UsuarioWithRolesResponse",
+    "Page",
 ]
 
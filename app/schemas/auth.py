@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr, Field
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional, Tuple
 from uuid import UUID
 
 
@@ -90,6 +90,24 @@ class PermisoInfo(BaseModel):
         from_attributes = True
 
 
+class AuthorizeRequest(BaseModel):
+    """Request schema for a batch of permission checks."""
+    checks: List[Tuple[str, str]] = Field(..., min_length=1, max_length=256)  # (accion, recurso)
+
+
+class AuthorizeResponse(BaseModel):
+    """Response schema for a batch of permission checks (same order as the request)."""
+    id_usuario: int
+    id_empresa: int
+    allowed: List[bool]
+
+
+class ClaimsTokenResponse(BaseModel):
+    """Response schema for an on-demand permission claims token."""
+    token: str
+    expires_in: int  # Seconds
+
+
 # Update forward references
 LoginResponse.model_rebuild()
 UserResponse.model_rebuild()
@@ -0,0 +1,10 @@
+from pydantic import BaseModel
+from typing import Generic, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class Page(BaseModel, Generic[T]):
+    """One page of a keyset-paginated list."""
+    items: List[T]
+    next_cursor: Optional[str] = None  # Pass as `cursor` to get the next page; null on the last page
@@ -25,6 +25,7 @@ class RolResponse(BaseModel):
     descripcion: Optional[str]
     empresas_id_empresa: int
     permisos: List["PermisoInfo"]
+    usuarios_count: Optional[int] = None  # Only filled in by GET /roles
 
     class Config:
         from_attributes = True
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr, Field
-from typing import Optional
+from pydantic import BaseModel, EmailStr, Field, field_validator
+from typing import List, Optional
 from datetime import datetime
 
 
@@ -33,3 +33,35 @@ class UsuarioResponse(BaseModel):
     class Config:
         from_attributes = True
 
+
+
+class UsuarioBulkRow(UsuarioCreate):
+    """One row of a bulk user import (CSV or NDJSON)."""
+    roles_ids: List[int] = []
+
+    @field_validator("roles_ids", mode="before")
+    @classmethod
+    def split_roles_ids(cls, value):
+        # CSV cells carry role ids as "1;2;3"
+        if value is None:
+            return []
+        if isinstance(value, str):
+            return [part.strip() for part in value.split(";") if part.strip()]
+        return value
+
+
+class UsuarioBulkResult(BaseModel):
+    """Outcome of one imported row."""
+    fila: int  # 1-based row number in the uploaded file (CSV header excluded)
+    email: Optional[str] = None
+    creado: bool
+    id_usuario: Optional[int] = None
+    error: Optional[str] = None
+
+
+class UsuarioBulkResponse(BaseModel):
+    """Report of a bulk user import."""
+    total: int
+    creados: int
+    fallidos: int
+    resultados: List[UsuarioBulkResult]
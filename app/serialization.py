@@ -0,0 +1,38 @@
+from functools import lru_cache
+from typing import Any, List, Optional
+
+import orjson
+from fastapi.responses import Response
+from pydantic import TypeAdapter
+
+# "Z" for UTC datetimes, the same format pydantic produces for response_model output
+ORJSON_OPTIONS = orjson.OPT_UTC_Z
+
+
+@lru_cache(maxsize=None)
+def type_adapter(tp: Any) -> TypeAdapter:
+    """Cached TypeAdapter, so each response type builds its serializer once."""
+    return TypeAdapter(tp)
+
+
+def json_bytes_response(content: bytes, status_code: int = 200) -> Response:
+    """Send already-encoded JSON as is."""
+    return Response(content=content, status_code=status_code, media_type="application/json")
+
+
+def model_response(tp: Any, value: Any, status_code: int = 200) -> Response:
+    """
+    Serialize trusted data of type `tp` straight to JSON bytes.
+
+    Returning a Response bypasses FastAPI's response_model validation, so
+    `value` must already match `tp` (e.g. built with `model_construct`).
+    Keep `response_model` on the route for the OpenAPI schema.
+    """
+    return json_bytes_response(type_adapter(tp).dump_json(value), status_code)
+
+
+def page_response(items: List[dict], next_cursor: Optional[str]) -> Response:
+    """Encode a `Page` whose items are plain dicts (database rows) with orjson."""
+    return json_bytes_response(
+        orjson.dumps({"items": items, "next_cursor": next_cursor}, option=ORJSON_OPTIONS)
+    )
@@ -1,12 +1,24 @@
+import asyncio
+import hashlib
+import logging
+import time
+from typing import Dict, Tuple
+
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, func
 from uuid import UUID
 from fastapi import HTTPException, status
+from supabase import AuthApiError, AuthInvalidCredentialsError
 
 from app.models.empresa import Empresa
 from app.models.usuario import Usuario
-from app.services.supabase_service import get_supabase_auth_client
+from app.services.supabase_service import get_supabase_client, get_supabase_auth_client
+from app.services.auth_user_mirror import find_auth_user_by_email, upsert_auth_user
 from app.schemas.auth import RegisterOwnerRequest
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
 
 
 async def register_owner(
@@ -14,11 +26,11 @@ async def register_owner(
     db: AsyncSession,
 ) -> tuple[Usuario, Empresa]:
     """Register a new owner with company."""
-    supabase = get_supabase_auth_client()
+    supabase = get_supabase_client()
     
     # Check if email already exists in database
     result = await db.execute(
-        select(Usuario).where(Usuario.email == request.email)
+        select(Usuario).where(func.lower(Usuario.email) == request.email.lower())
     )
     existing_user = result.scalar_one_or_none()
     if existing_user:
@@ -27,25 +39,17 @@ async def register_owner(
             detail="Email already registered in database",
         )
     
-    # Check if email already exists in Supabase Auth
-    try:
-        # Try to get user by email from Supabase
-        auth_users = supabase.auth.admin.list_users()
-        for user in auth_users.users:
-            if user.email == request.email:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Email already registered in authentication service",
-                )
-    except HTTPException:
-        raise
-    except Exception:
-        # If we can't check, continue (Supabase will return error if exists)
-        pass
+    # Check if email already exists in Supabase Auth (local mirror, indexed lookup;
+    # Supabase still rejects duplicates the mirror has not seen yet)
+    if await find_auth_user_by_email(db, request.email):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email already registered in authentication service",
+        )
     
     # Create user in Supabase Auth
     try:
-        auth_response = supabase.auth.admin.create_user({
+        auth_response = await supabase.auth.admin.create_user({
             "email": request.email,
             "password": request.password,
             "email_confirm": True,  # Auto-confirm email
@@ -65,6 +69,8 @@ async def register_owner(
             detail=f"Failed to create authentication user: {str(e)}",
         )
     
+    await upsert_auth_user(db, auth_uid, request.email)
+    
     # Create empresa
     empresa = Empresa(
         nombre=request.nombre_empresa,
@@ -89,54 +95,168 @@ async def register_owner(
         empresas_id_empresa=empresa.id_empresa,
     )
     db.add(usuario)
-    await db.flush()
-    
-    await db.commit()
+    await db.flush()  # The caller's get_db commits
     
     return usuario, empresa
 
 
 async def login(email: str, password: str) -> dict:
-    """Authenticate user and return tokens."""
+    """
+    Authenticate user and return tokens.
+
+    Only rejected credentials are a 401 (counted by the login throttle);
+    Supabase being unreachable, rate limited or failing is a 502/503.
+    """
     supabase = get_supabase_auth_client()
     
     try:
         # Sign in with Supabase
-        response = supabase.auth.sign_in_with_password({
+        response = await supabase.auth.sign_in_with_password({
             "email": email,
             "password": password,
         })
-        
-        if not response.user or not response.session:
+    except AuthInvalidCredentialsError as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=f"Authentication failed: {e.message}",
+        )
+    except AuthApiError as e:
+        if e.status == status.HTTP_429_TOO_MANY_REQUESTS or e.status >= 500:
             raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid email or password",
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=f"Authentication service unavailable: {e.message}",
             )
-        
-        access_token = response.session.access_token
-        refresh_token = response.session.refresh_token
-        
-        return {
-            "access_token": access_token,
-            "refresh_token": refresh_token,
-            "user_id": response.user.id,
-        }
-        
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=f"Authentication failed: {e.message}",
+        )
     except Exception as e:
+        # Timeouts, connection errors, retryable upstream errors
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"Authentication service error: {str(e)}",
+        )
+    
+    if not response.user or not response.session:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=f"Authentication failed: {str(e)}",
+            detail="Invalid email or password",
         )
+    
+    return {
+        "access_token": response.session.access_token,
+        "refresh_token": response.session.refresh_token,
+        "user_id": response.user.id,
+    }
 
 
-async def logout(access_token: str) -> None:
-    """Logout user and invalidate session."""
+async def _refresh_upstream(refresh_token: str) -> dict:
+    """Exchange a refresh token for a new session with Supabase."""
     supabase = get_supabase_auth_client()
     
     try:
-        # Sign out using the access token
-        supabase.auth.sign_out()
-    except Exception:
-        # Even if logout fails, we still return success
-        pass
+        response = await supabase.auth.refresh_session(refresh_token)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=f"Session refresh failed: {str(e)}",
+        )
+    
+    if not response.user or not response.session:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Session refresh failed",
+        )
+    
+    return {
+        "access_token": response.session.access_token,
+        "refresh_token": response.session.refresh_token,
+        "user_id": response.user.id,
+    }
+
 
+class SessionRefresher:
+    """
+    Single-flight refresh: concurrent requests presenting the same refresh
+    token share one upstream call.
+    
+    The result is also kept for `result_ttl_seconds`, because requests sent
+    before the browser stored the new cookies still carry the old (already
+    rotated) refresh token.
+    """
+    
+    def __init__(self, result_ttl_seconds: float):
+        self.result_ttl_seconds = result_ttl_seconds
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._recent: Dict[str, Tuple[float, dict]] = {}
+        self.upstream_calls = 0
+        self.shared = 0
+    
+    @staticmethod
+    def _key(refresh_token: str) -> str:
+        return hashlib.sha256(refresh_token.encode()).hexdigest()
+    
+    async def refresh(self, refresh_token: str) -> dict:
+        """Return a new session for `refresh_token`, calling Supabase at most once."""
+        key = self._key(refresh_token)
+        now = time.monotonic()
+        
+        recent = self._recent.get(key)
+        if recent is not None:
+            if now < recent[0]:
+                self.shared += 1
+                return recent[1]
+            del self._recent[key]
+        
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._run(key, refresh_token))
+            self._inflight[key] = task
+        else:
+            self.shared += 1
+        
+        # Shielded: a caller that disconnects must not cancel the others' refresh
+        return await asyncio.shield(task)
+    
+    async def _run(self, key: str, refresh_token: str) -> dict:
+        self.upstream_calls += 1
+        try:
+            tokens = await _refresh_upstream(refresh_token)
+            self._remember(key, tokens)
+            return tokens
+        finally:
+            self._inflight.pop(key, None)
+    
+    def _remember(self, key: str, tokens: dict) -> None:
+        now = time.monotonic()
+        # Drop expired results so the map stays small
+        for old_key in [k for k, (expires_at, _) in self._recent.items() if expires_at <= now]:
+            del self._recent[old_key]
+        self._recent[key] = (now + self.result_ttl_seconds, tokens)
+    
+    def forget(self, refresh_token: str) -> None:
+        """Drop a remembered result (logout), so the old token cannot reuse it."""
+        self._recent.pop(self._key(refresh_token), None)
+    
+    def stats(self) -> dict:
+        """Counters for monitoring."""
+        return {
+            "upstream_calls": self.upstream_calls,
+            "shared": self.shared,
+            "in_flight": len(self._inflight),
+        }
+
+
+session_refresher = SessionRefresher(settings.token_refresh_reuse_seconds)
+
+
+async def logout(access_token: str) -> None:
+    """Sign out the token's session in Supabase, revoking its refresh tokens."""
+    supabase = get_supabase_client()
+    
+    try:
+        # Admin sign-out acts on the session of the given JWT, not on the client's
+        await supabase.auth.admin.sign_out(access_token, "local")
+    except Exception as e:
+        # The access token is revoked locally regardless (see token_revocation)
+        logger.warning(f"Supabase sign-out failed: {e}")
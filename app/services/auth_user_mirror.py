@@ -0,0 +1,142 @@
+import asyncio
+import logging
+from typing import List, Optional
+from uuid import UUID
+
+from sqlalchemy import select, delete, func, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import get_settings
+from app.database import AsyncSessionLocal
+from app.models.auth_usuario import AuthUsuario
+from app.services.supabase_service import get_supabase_client
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Arbitrary key for pg_try_advisory_xact_lock, so only one worker reconciles at a time
+_RECONCILE_LOCK_KEY = 0x61757468
+
+
+async def find_auth_user_by_email(
+    db: AsyncSession,
+    email: str,
+    exclude_auth_uid: Optional[UUID] = None,
+) -> Optional[AuthUsuario]:
+    """Find a mirrored auth user by email (case-insensitive, indexed)."""
+    query = select(AuthUsuario).where(func.lower(AuthUsuario.email) == email.lower())
+    if exclude_auth_uid is not None:
+        query = query.where(AuthUsuario.auth_uid != exclude_auth_uid)
+    result = await db.execute(query)
+    return result.scalar_one_or_none()
+
+
+async def upsert_auth_users(db: AsyncSession, rows: List[dict]) -> None:
+    """
+    Insert or update mirrored auth users (`auth_uid`, `email` dicts). Does not commit.
+
+    Supabase is the source of truth: a mirror row of another user that still
+    holds one of these emails is stale (the email moved between users outside
+    this service) and is deleted first, so the unique index on lower(email)
+    cannot reject the upsert. That user gets its current email back on its
+    next upsert or reconciliation.
+    """
+    if not rows:
+        return
+    holders = {(row["email"].lower(), row["auth_uid"]) for row in rows}
+    await db.execute(
+        delete(AuthUsuario).where(
+            func.lower(AuthUsuario.email).in_([email for email, _ in holders]),
+            tuple_(func.lower(AuthUsuario.email), AuthUsuario.auth_uid).not_in(list(holders)),
+        )
+    )
+    stmt = insert(AuthUsuario).values(rows)
+    await db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[AuthUsuario.auth_uid],
+            set_={"email": stmt.excluded.email, "fecha_sincronizacion": func.now()},
+        )
+    )
+
+
+async def upsert_auth_user(db: AsyncSession, auth_uid: UUID, email: str) -> None:
+    """Insert or update one mirrored auth user. Does not commit."""
+    await upsert_auth_users(db, [{"auth_uid": auth_uid, "email": email}])
+
+
+async def reconcile_auth_users(db: AsyncSession) -> Optional[int]:
+    """
+    Copy every Supabase Auth user into the mirror and drop users that no longer exist.
+
+    Returns the number of users mirrored, or None if another worker holds the lock.
+    """
+    locked = await db.scalar(select(func.pg_try_advisory_xact_lock(_RECONCILE_LOCK_KEY)))
+    if not locked:
+        return None
+
+    supabase = get_supabase_client()
+    per_page = settings.auth_mirror_page_size
+    mirrored = 0
+    page = 1
+
+    while True:
+        users = await supabase.auth.admin.list_users(page=page, per_page=per_page)
+        rows = [
+            {"auth_uid": UUID(user.id), "email": user.email}
+            for user in users
+            if user.email
+        ]
+        if rows:
+            await upsert_auth_users(db, rows)
+            mirrored += len(rows)
+        if len(users) < per_page:
+            break
+        page += 1
+
+    # Every row seen above was stamped with this transaction's now();
+    # anything older was deleted directly in Supabase
+    if mirrored:
+        await db.execute(
+            delete(AuthUsuario).where(AuthUsuario.fecha_sincronizacion < func.now())
+        )
+
+    await db.commit()
+    return mirrored
+
+
+async def run_reconciliation() -> None:
+    """Run one reconciliation pass in its own session."""
+    async with AsyncSessionLocal() as session:
+        try:
+            count = await reconcile_auth_users(session)
+        except Exception:
+            await session.rollback()
+            raise
+    if count is not None:
+        logger.info(f"Auth user mirror reconciled: {count} users")
+
+
+async def reconciliation_loop(interval_seconds: float) -> None:
+    """Background task: reconcile now and then every `interval_seconds`."""
+    while True:
+        try:
+            await run_reconciliation()
+        except Exception as e:
+            logger.warning(f"Auth user mirror reconciliation failed: {e}")
+        await asyncio.sleep(interval_seconds)
+
+
+if __name__ == "__main__":
+    # One-off reconciliation: python -m app.services.auth_user_mirror
+    from app.services.supabase_service import init_supabase_clients, close_supabase_clients
+
+    async def _main() -> None:
+        await init_supabase_clients()
+        try:
+            await run_reconciliation()
+        finally:
+            await close_supabase_clients()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
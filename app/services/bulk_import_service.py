@@ -0,0 +1,243 @@
+import asyncio
+import csv
+import io
+import json
+import logging
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+
+from fastapi import HTTPException, status
+from pydantic import ValidationError
+from sqlalchemy import select, func, union
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import get_settings
+from app.database import after_rollback
+from app.models.auth_usuario import AuthUsuario
+from app.models.rol import Rol, UsuarioRol
+from app.models.usuario import Usuario
+from app.schemas.usuario import UsuarioBulkRow, UsuarioBulkResult
+from app.services.auth_user_mirror import upsert_auth_users
+from app.services.supabase_service import get_supabase_client
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+CSV_CONTENT_TYPES = {"text/csv", "application/csv"}
+NDJSON_CONTENT_TYPES = {"application/x-ndjson", "application/ndjson", "application/jsonl"}
+
+
+def parse_import_file(content_type: str, body: bytes) -> List[dict]:
+    """Parse a CSV (with header) or NDJSON upload into raw row dicts."""
+    media_type = content_type.split(";")[0].strip().lower()
+    try:
+        text_body = body.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Import file must be UTF-8 encoded",
+        )
+
+    if media_type in CSV_CONTENT_TYPES:
+        rows = [dict(row) for row in csv.DictReader(io.StringIO(text_body))]
+    elif media_type in NDJSON_CONTENT_TYPES:
+        rows = []
+        for line_number, line in enumerate(text_body.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Invalid JSON on line {line_number}",
+                )
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Content-Type must be text/csv or application/x-ndjson",
+        )
+
+    if len(rows) > settings.bulk_import_max_rows:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Import is limited to {settings.bulk_import_max_rows} rows",
+        )
+    return rows
+
+
+async def _create_auth_users(
+    rows: List[Tuple[int, UsuarioBulkRow]],
+) -> Dict[int, Tuple[Optional[UUID], Optional[str]]]:
+    """Create Supabase users with bounded concurrency. Returns {fila: (auth_uid, error)}."""
+    supabase = get_supabase_client()
+    semaphore = asyncio.Semaphore(settings.bulk_import_concurrency)
+
+    async def create_one(fila: int, row: UsuarioBulkRow):
+        async with semaphore:
+            try:
+                auth_response = await supabase.auth.admin.create_user({
+                    "email": row.email,
+                    "password": row.password,
+                    "email_confirm": True,
+                })
+                if not auth_response.user:
+                    return fila, (None, "Failed to create user in authentication service")
+                return fila, (UUID(auth_response.user.id), None)
+            except Exception as e:
+                return fila, (None, f"Failed to create authentication user: {str(e)}")
+
+    results = await asyncio.gather(*(create_one(fila, row) for fila, row in rows))
+    return dict(results)
+
+
+async def _delete_auth_users(auth_uids: List[UUID]) -> None:
+    """Best-effort cleanup of Supabase users whose database rows were not written."""
+    supabase = get_supabase_client()
+    semaphore = asyncio.Semaphore(settings.bulk_import_concurrency)
+
+    async def delete_one(auth_uid: UUID):
+        async with semaphore:
+            try:
+                await supabase.auth.admin.delete_user(str(auth_uid))
+            except Exception as e:
+                logger.error(f"Could not delete orphaned auth user {auth_uid}: {e}")
+
+    await asyncio.gather(*(delete_one(auth_uid) for auth_uid in auth_uids))
+
+
+async def import_usuarios(
+    raw_rows: List[dict],
+    id_empresa: int,
+    db: AsyncSession,
+) -> List[UsuarioBulkResult]:
+    """
+    Validate, provision and insert a batch of employees.
+
+    Rows are validated in Python and against the database in one query, the
+    Supabase users are created concurrently and every database write is a
+    batched multi-row INSERT. Rows that fail do not stop the others.
+    Does not commit: the caller's `get_db` owns the transaction.
+    """
+    results: Dict[int, UsuarioBulkResult] = {}
+    valid: List[Tuple[int, UsuarioBulkRow]] = []
+    seen_emails = set()
+
+    # 1. Schema validation and duplicates within the file
+    for fila, raw in enumerate(raw_rows, start=1):
+        email = raw.get("email") if isinstance(raw, dict) else None
+        if not isinstance(email, str):
+            email = None  # Echoed back only if it is text; NDJSON rows can hold any JSON
+        try:
+            row = UsuarioBulkRow.model_validate(raw)
+        except ValidationError as e:
+            error = "; ".join(
+                f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}" for err in e.errors()
+            )
+            results[fila] = UsuarioBulkResult(fila=fila, email=email, creado=False, error=error)
+            continue
+
+        key = row.email.lower()
+        if key in seen_emails:
+            results[fila] = UsuarioBulkResult(
+                fila=fila, email=row.email, creado=False, error="Duplicate email in import file"
+            )
+            continue
+        seen_emails.add(key)
+        valid.append((fila, row))
+
+    # 2. One query for emails already registered (database or auth mirror)
+    # and one for the referenced roles
+    if valid:
+        emails = [row.email.lower() for _, row in valid]
+        existing_result = await db.execute(
+            union(
+                select(func.lower(Usuario.email)).where(func.lower(Usuario.email).in_(emails)),
+                select(func.lower(AuthUsuario.email)).where(func.lower(AuthUsuario.email).in_(emails)),
+            )
+        )
+        existing_emails = set(existing_result.scalars().all())
+
+        requested_roles = {rol_id for _, row in valid for rol_id in row.roles_ids}
+        company_roles = set()
+        if requested_roles:
+            roles_result = await db.execute(
+                select(Rol.id_rol).where(
+                    Rol.id_rol.in_(requested_roles),
+                    Rol.empresas_id_empresa == id_empresa,
+                )
+            )
+            company_roles = set(roles_result.scalars().all())
+
+        checked = []
+        for fila, row in valid:
+            if row.email.lower() in existing_emails:
+                error = "Email already registered"
+            elif set(row.roles_ids) - company_roles:
+                missing = sorted(set(row.roles_ids) - company_roles)
+                error = f"Roles not found or do not belong to your company: {missing}"
+            else:
+                checked.append((fila, row))
+                continue
+            results[fila] = UsuarioBulkResult(fila=fila, email=row.email, creado=False, error=error)
+        valid = checked
+
+    # 3. Supabase users, bounded concurrency
+    provisioned: List[Tuple[int, UsuarioBulkRow, UUID]] = []
+    if valid:
+        auth_results = await _create_auth_users(valid)
+        for fila, row in valid:
+            auth_uid, error = auth_results[fila]
+            if error:
+                results[fila] = UsuarioBulkResult(fila=fila, email=row.email, creado=False, error=error)
+            else:
+                provisioned.append((fila, row, auth_uid))
+
+    # 4. Multi-row inserts: usuarios, auth mirror, role assignments.
+    # Committed by the caller's get_db; if that transaction rolls back, the
+    # Supabase users created above are deleted again
+    if provisioned:
+        after_rollback(db, _delete_auth_users, [auth_uid for _, _, auth_uid in provisioned])
+
+        # executemany with RETURNING: SQLAlchemy renders these as multi-row
+        # INSERT ... VALUES batches (insertmanyvalues), within the bind limit
+        insert_result = await db.execute(
+            insert(Usuario).returning(Usuario.auth_uid, Usuario.id_usuario),
+            [
+                {
+                    "auth_uid": auth_uid,
+                    "nombre": row.nombre,
+                    "apellido": row.apellido,
+                    "email": row.email,
+                    "es_dueno": False,
+                    "estado": True,
+                    "empresas_id_empresa": id_empresa,
+                }
+                for _, row, auth_uid in provisioned
+            ],
+        )
+        ids_by_auth_uid = {auth_uid: id_usuario for auth_uid, id_usuario in insert_result.all()}
+
+        await upsert_auth_users(
+            db,
+            [{"auth_uid": auth_uid, "email": row.email} for _, row, auth_uid in provisioned],
+        )
+
+        assignments = [
+            {"usuarios_id_usuario": ids_by_auth_uid[auth_uid], "roles_id_rol": rol_id}
+            for _, row, auth_uid in provisioned
+            for rol_id in set(row.roles_ids)
+        ]
+        if assignments:
+            await db.execute(insert(UsuarioRol).on_conflict_do_nothing(), assignments)
+
+        for fila, row, auth_uid in provisioned:
+            results[fila] = UsuarioBulkResult(
+                fila=fila,
+                email=row.email,
+                creado=True,
+                id_usuario=ids_by_auth_uid[auth_uid],
+            )
+
+    return [results[fila] for fila in sorted(results)]
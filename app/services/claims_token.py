@@ -0,0 +1,188 @@
+import asyncio
+import base64
+import hashlib
+import json
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.serialization import load_pem_private_key
+from jwt.algorithms import ECAlgorithm
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import get_settings
+from app.models.permiso import Permiso
+from app.services.data_version import CATALOGO_PERMISOS, version_subquery
+from app.services.principal_cache import PermisoSnapshot
+
+settings = get_settings()
+
+ALGORITHM = "ES256"
+
+
+def _b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def encode_permissions(permisos: Iterable[PermisoSnapshot], positions: Dict[int, int]) -> str:
+    """
+    Bitmask over the `Permiso` catalog, little-endian, base64url.
+
+    Bits are dense catalog positions (`positions`: id_permiso -> bit), so the
+    size follows the catalog, not the id sequence. Permissions missing from
+    `positions` (newer than the loaded catalog) are left out.
+    """
+    mask = 0
+    for permiso in permisos:
+        position = positions.get(permiso.id_permiso)
+        if position is not None:
+            mask |= 1 << position
+    return _b64url(mask.to_bytes(max(1, (mask.bit_length() + 7) // 8), "little"))
+
+
+def decode_permissions(encoded: str) -> int:
+    """Inverse of `encode_permissions`: test a permission with `mask >> bit & 1`."""
+    return int.from_bytes(base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4)), "little")
+
+
+class PermissionCatalog:
+    """
+    The permission catalog in `id_permiso` order, cached per catalog version.
+
+    An entry's index is its bit in claims tokens. Deleting a permission
+    shifts later bits, but also bumps the catalog version recorded in the
+    token, so downstream services reload the mapping from /auth/claims-keys.
+    """
+
+    def __init__(self):
+        self.version: Optional[int] = None
+        self.permisos: List[dict] = []  # {"bit", "id_permiso", "accion", "recurso"}
+        self.positions: Dict[int, int] = {}  # id_permiso -> bit
+        self._lock = asyncio.Lock()
+
+    async def load(self, db: AsyncSession, version: int) -> "PermissionCatalog":
+        """Ensure the catalog is loaded at `version` or later (one statement on a change)."""
+        if self.version is not None and self.version >= version:
+            return self
+        async with self._lock:
+            if self.version is not None and self.version >= version:
+                return self
+            result = await db.execute(
+                select(
+                    Permiso.id_permiso,
+                    Permiso.accion,
+                    Permiso.recurso,
+                    version_subquery(CATALOGO_PERMISOS).label("version"),
+                ).order_by(Permiso.id_permiso)
+            )
+            rows = result.all()
+            self.permisos = [
+                {"bit": bit, "id_permiso": id_permiso, "accion": accion, "recurso": recurso}
+                for bit, (id_permiso, accion, recurso, _) in enumerate(rows)
+            ]
+            self.positions = {entry["id_permiso"]: entry["bit"] for entry in self.permisos}
+            self.version = rows[0].version if rows else version
+        return self
+
+
+permission_catalog = PermissionCatalog()
+
+
+class ClaimsSigner:
+    """
+    Mints short-lived ES256 tokens with a user's permission set.
+
+    Downstream services verify them with the public key published at
+    `GET /auth/claims-keys` and authorize requests without calling back.
+    Each token records the data versions it was built from, so it is
+    re-minted as soon as the user's roles or the catalog change.
+    """
+
+    def __init__(self, private_key_pem: str, issuer: str, ttl_seconds: int):
+        private_key = load_pem_private_key(private_key_pem.replace("\\n", "\n").encode(), password=None)
+        if not isinstance(private_key, ec.EllipticCurvePrivateKey) or private_key.curve.name != "secp256r1":
+            raise ValueError("CLAIMS_SIGNING_KEY must be a P-256 EC private key")
+        self._private_key = private_key
+        self.issuer = issuer
+        self.ttl_seconds = ttl_seconds
+        jwk = json.loads(ECAlgorithm.to_jwk(self._private_key.public_key()))
+        # RFC 7638 thumbprint: stable key id derived from the public key
+        thumbprint_input = json.dumps(
+            {"crv": jwk["crv"], "kty": jwk["kty"], "x": jwk["x"], "y": jwk["y"]},
+            separators=(",", ":"),
+            sort_keys=True,
+        )
+        self.kid = _b64url(hashlib.sha256(thumbprint_input.encode()).digest())
+        self.public_jwk = {**jwk, "kid": self.kid, "alg": ALGORITHM, "use": "sig"}
+        self.minted = 0
+
+    def mint(
+        self,
+        auth_uid: UUID,
+        id_usuario: int,
+        id_empresa: int,
+        es_dueno: bool,
+        permisos: Iterable[PermisoSnapshot],
+        versiones: Tuple[int, int],
+        catalog: PermissionCatalog,
+    ) -> str:
+        """`versiones` is (company, catalog); the catalog one is taken from `catalog`."""
+        now = int(time.time())
+        self.minted += 1
+        return jwt.encode(
+            {
+                "iss": self.issuer,
+                "sub": str(auth_uid),
+                "iat": now,
+                "exp": now + self.ttl_seconds,
+                "id_usuario": id_usuario,
+                "id_empresa": id_empresa,
+                "es_dueno": es_dueno,
+                "permisos": encode_permissions(permisos, catalog.positions),
+                # The catalog version identifies the bit mapping used above
+                "versiones": [versiones[0], catalog.version],
+            },
+            self._private_key,
+            algorithm=ALGORITHM,
+            headers={"kid": self.kid},
+        )
+
+    def needs_rotation(self, token: str, id_usuario: int, versiones: Tuple[int, int]) -> bool:
+        """
+        Whether a token presented back by the client must be re-minted:
+        another user or signing key, data changed since it was minted, or
+        less than half its lifetime left. The signature is not checked; a
+        forged token can at worst trigger a fresh, genuine one.
+        """
+        try:
+            token_data = jwt.decode_complete(token, options={"verify_signature": False})
+        except jwt.PyJWTError:
+            return True
+        claims = token_data["payload"]
+        token_versions = claims.get("versiones")
+        return (
+            token_data["header"].get("kid") != self.kid
+            or claims.get("id_usuario") != id_usuario
+            or not isinstance(token_versions, list)
+            or len(token_versions) != 2
+            or token_versions[0] != versiones[0]
+            # The token's catalog may be newer than the (cached) principal's
+            or not isinstance(token_versions[1], int)
+            or token_versions[1] < versiones[1]
+            or not isinstance(claims.get("exp"), (int, float))
+            or claims["exp"] - time.time() < self.ttl_seconds / 2
+        )
+
+    def stats(self) -> dict:
+        """Counters for monitoring."""
+        return {"kid": self.kid, "minted": self.minted}
+
+
+claims_signer: Optional[ClaimsSigner] = (
+    ClaimsSigner(settings.claims_signing_key, settings.claims_issuer, settings.claims_token_ttl_seconds)
+    if settings.claims_signing_key
+    else None
+)
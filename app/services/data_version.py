@@ -0,0 +1,89 @@
+import hashlib
+from typing import Optional, Tuple
+
+from fastapi import Request, Response, status
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.version_datos import VersionDatos
+
+CATALOGO_PERMISOS = "permisos"
+
+
+def empresa_key(id_empresa: int) -> str:
+    return f"empresa:{id_empresa}"
+
+
+async def _bump(db: AsyncSession, clave: str) -> None:
+    stmt = insert(VersionDatos).values(clave=clave, version=1)
+    await db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[VersionDatos.clave],
+            set_={"version": VersionDatos.version + 1, "fecha_actualizacion": func.now()},
+        )
+    )
+
+
+async def bump_empresa_version(db: AsyncSession, id_empresa: int) -> None:
+    """Mark the company's users/roles/company data as changed. Does not commit."""
+    await _bump(db, empresa_key(id_empresa))
+
+
+async def bump_catalog_version(db: AsyncSession) -> None:
+    """Mark the global permission catalog as changed. Does not commit."""
+    await _bump(db, CATALOGO_PERMISOS)
+
+
+def version_subquery(clave):
+    """Scalar subquery with the counter for `clave` (0 if never bumped)."""
+    return func.coalesce(
+        select(VersionDatos.version).where(VersionDatos.clave == clave).scalar_subquery(),
+        0,
+    )
+
+
+async def get_versions(
+    db: AsyncSession,
+    id_empresa: Optional[int] = None,
+    catalog: bool = False,
+) -> Tuple[int, ...]:
+    """Current counters, in one query: (empresa?, catalog?)."""
+    columns = []
+    if id_empresa is not None:
+        columns.append(version_subquery(empresa_key(id_empresa)))
+    if catalog:
+        columns.append(version_subquery(CATALOGO_PERMISOS))
+    row = (await db.execute(select(*columns))).one()
+    return tuple(row)
+
+
+def make_etag(request: Request, *parts) -> str:
+    """Weak ETag for this URL (path and query string) at the given versions."""
+    digest = hashlib.blake2b(digest_size=12)
+    digest.update(request.url.path.encode())
+    digest.update(b"?")
+    digest.update(request.url.query.encode())
+    for part in parts:
+        digest.update(b"|")
+        digest.update(str(part).encode())
+    return f'W/"{digest.hexdigest()}"'
+
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """A 304 response if the client already holds `etag`, otherwise None."""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return None
+    candidates = {candidate.strip() for candidate in if_none_match.split(",")}
+    # Weak comparison (RFC 9110): W/"x" and "x" match
+    if "*" in candidates or etag in candidates or etag[2:] in candidates:
+        return with_etag(Response(status_code=status.HTTP_304_NOT_MODIFIED), etag)
+    return None
+
+
+def with_etag(response: Response, etag: str) -> Response:
+    """Attach the ETag and ask clients to revalidate before reusing the body."""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
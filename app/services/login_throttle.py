@@ -0,0 +1,256 @@
+import math
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Tuple
+
+from fastapi import HTTPException, Request, status
+from sqlalchemy import case, func, literal_column, update
+from sqlalchemy.dialects.postgresql import insert
+
+from app.config import get_settings
+from app.database import AsyncSessionLocal
+from app.models.limite_login import LimiteLogin
+
+settings = get_settings()
+
+_SHARED_WINDOW = timedelta(minutes=1)
+
+
+def normalize_email(email: str) -> str:
+    return email.strip().lower()
+
+
+def client_ip(request: Request) -> str:
+    """
+    Client address for the per-IP bucket.
+
+    Behind LOGIN_TRUSTED_PROXY_COUNT proxies, each appending the address it
+    saw to X-Forwarded-For, the client is the entry that many hops from the
+    right; anything further left was sent by the client and can be forged.
+    """
+    trusted = settings.login_trusted_proxy_count
+    if trusted > 0:
+        forwarded = [
+            entry.strip()
+            for header in request.headers.getlist("x-forwarded-for")
+            for entry in header.split(",")
+            if entry.strip()
+        ]
+        if len(forwarded) >= trusted:
+            return forwarded[-trusted]
+    return request.client.host if request.client else "unknown"
+
+
+def _too_many_attempts(retry_after: float) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Too many login attempts, try again later",
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+class TokenBuckets:
+    """Token bucket per key, bounded to `max_keys` (least recently used dropped)."""
+
+    def __init__(self, per_minute: float, burst: int, max_keys: int):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()  # key -> (tokens, updated_at)
+
+    def take(self, key: str) -> float:
+        """Consume one token. Returns 0 if allowed, else seconds until one is available."""
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(key, (float(self.burst), now))
+        tokens = min(float(self.burst), tokens + (now - updated_at) * self.rate)
+
+        if tokens >= 1.0:
+            retry_after = 0.0
+            tokens -= 1.0
+        else:
+            retry_after = (1.0 - tokens) / self.rate if self.rate > 0 else 60.0
+
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+
+def lockout_seconds(failures: int) -> float:
+    """Lock duration after `failures` consecutive failures (0 below the threshold)."""
+    if failures < settings.login_lockout_threshold:
+        return 0.0
+    exponent = failures - settings.login_lockout_threshold
+    return min(settings.login_lockout_max_seconds, settings.login_lockout_base_seconds * (2 ** min(exponent, 32)))
+
+
+class Lockouts:
+    """Consecutive failures per key with exponentially growing locks."""
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._state: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()  # key -> (failures, locked_until)
+
+    def retry_after(self, key: str) -> float:
+        state = self._state.get(key)
+        if state is None:
+            return 0.0
+        return max(0.0, state[1] - time.monotonic())
+
+    def failure(self, key: str) -> bool:
+        """Record a failure. Returns True if it starts a lock."""
+        failures = self._state.get(key, (0, 0.0))[0] + 1
+        duration = lockout_seconds(failures)
+        self._state[key] = (failures, time.monotonic() + duration)
+        self._state.move_to_end(key)
+        while len(self._state) > self.max_keys:
+            self._state.popitem(last=False)
+        return duration > 0
+
+    def success(self, key: str) -> None:
+        self._state.pop(key, None)
+
+
+class LoginThrottle:
+    """
+    Sheds login attempts before any Supabase or database work.
+
+    In-process token buckets per client IP and per normalized email, plus an
+    exponential lockout per email after repeated failures. With
+    LOGIN_THROTTLE_SHARED, the same limits are also enforced across workers
+    through a Postgres counter table.
+    """
+
+    def __init__(self):
+        max_keys = settings.login_throttle_max_keys
+        self._ip_buckets = TokenBuckets(settings.login_rate_ip_per_minute, settings.login_rate_ip_burst, max_keys)
+        self._email_buckets = TokenBuckets(
+            settings.login_rate_email_per_minute, settings.login_rate_email_burst, max_keys
+        )
+        self._lockouts = Lockouts(max_keys)
+        self.shed_lockout = 0
+        self.shed_ip = 0
+        self.shed_email = 0
+        self.shed_shared = 0
+        self.failures = 0
+        self.lockouts = 0
+
+    def check(self, ip: str, email: str) -> None:
+        """In-process limits; raises 429 with Retry-After. No I/O."""
+        email_key = normalize_email(email)
+
+        retry_after = self._lockouts.retry_after(email_key)
+        if retry_after > 0:
+            self.shed_lockout += 1
+            raise _too_many_attempts(retry_after)
+
+        retry_after = self._ip_buckets.take(ip)
+        if retry_after > 0:
+            self.shed_ip += 1
+            raise _too_many_attempts(retry_after)
+
+        retry_after = self._email_buckets.take(email_key)
+        if retry_after > 0:
+            self.shed_email += 1
+            raise _too_many_attempts(retry_after)
+
+    async def check_shared(self, ip: str, email: str) -> None:
+        """Cross-worker limits (one statement). Raises 429 with Retry-After."""
+        if not settings.login_throttle_shared:
+            return
+
+        keys = {
+            f"ip:{ip}": settings.login_rate_ip_per_minute + settings.login_rate_ip_burst,
+            f"email:{normalize_email(email)}": settings.login_rate_email_per_minute + settings.login_rate_email_burst,
+        }
+        window_expired = LimiteLogin.ventana_inicio < func.now() - _SHARED_WINDOW
+        stmt = insert(LimiteLogin).values([{"clave": key, "intentos": 1, "fallos": 0} for key in keys])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[LimiteLogin.clave],
+            set_={
+                "intentos": case((window_expired, 1), else_=LimiteLogin.intentos + 1),
+                "ventana_inicio": case((window_expired, func.now()), else_=LimiteLogin.ventana_inicio),
+            },
+        ).returning(
+            LimiteLogin.clave,
+            LimiteLogin.intentos,
+            func.extract("epoch", LimiteLogin.ventana_inicio + _SHARED_WINDOW - func.now()),
+            func.extract("epoch", LimiteLogin.bloqueado_hasta - func.now()),
+        )
+
+        # Own short transaction: the counts must persist even if the login fails
+        async with AsyncSessionLocal() as session:
+            rows = (await session.execute(stmt)).all()
+            await session.commit()
+
+        retry_after = 0.0
+        for clave, intentos, window_left, locked_left in rows:
+            if locked_left is not None and locked_left > 0:
+                retry_after = max(retry_after, float(locked_left))
+            if intentos > keys[clave]:
+                retry_after = max(retry_after, float(window_left))
+        if retry_after > 0:
+            self.shed_shared += 1
+            raise _too_many_attempts(retry_after)
+
+    async def record_failure(self, email: str) -> None:
+        """A wrong password or unknown email: count toward the email's lockout."""
+        email_key = normalize_email(email)
+        self.failures += 1
+        if self._lockouts.failure(email_key):
+            self.lockouts += 1
+
+        if settings.login_throttle_shared:
+            failures = LimiteLogin.fallos + 1
+            lock_seconds = func.least(
+                settings.login_lockout_max_seconds,
+                settings.login_lockout_base_seconds
+                * func.power(2, func.least(failures - settings.login_lockout_threshold, 32)),
+            )
+            stmt = insert(LimiteLogin).values(clave=f"email:{email_key}", intentos=0, fallos=1)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[LimiteLogin.clave],
+                set_={
+                    "fallos": failures,
+                    "bloqueado_hasta": case(
+                        (
+                            failures >= settings.login_lockout_threshold,
+                            func.now() + literal_column("interval '1 second'") * lock_seconds,
+                        ),
+                        else_=LimiteLogin.bloqueado_hasta,
+                    ),
+                },
+            )
+            async with AsyncSessionLocal() as session:
+                await session.execute(stmt)
+                await session.commit()
+
+    async def record_success(self, email: str) -> None:
+        """Successful login: clear the email's failure count and lock."""
+        email_key = normalize_email(email)
+        self._lockouts.success(email_key)
+
+        if settings.login_throttle_shared:
+            async with AsyncSessionLocal() as session:
+                await session.execute(
+                    update(LimiteLogin)
+                    .where(LimiteLogin.clave == f"email:{email_key}", LimiteLogin.fallos > 0)
+                    .values(fallos=0, bloqueado_hasta=None)
+                )
+                await session.commit()
+
+    def stats(self) -> dict:
+        """Counters for monitoring."""
+        return {
+            "shed_lockout": self.shed_lockout,
+            "shed_ip": self.shed_ip,
+            "shed_email": self.shed_email,
+            "shed_shared": self.shed_shared,
+            "failures": self.failures,
+            "lockouts": self.lockouts,
+        }
+
+
+login_throttle = LoginThrottle()
@@ -0,0 +1,220 @@
+import sys
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, FrozenSet, Iterable, Optional, Set, Tuple
+from uuid import UUID
+
+from app.config import get_settings
+
+settings = get_settings()
+
+
+@dataclass(frozen=True)
+class UsuarioSnapshot:
+    """Immutable copy of a `Usuario` row."""
+    id_usuario: int
+    auth_uid: UUID
+    nombre: str
+    apellido: str
+    email: str
+    es_dueno: bool
+    estado: bool
+    fecha_creacion: Optional[datetime]
+    empresas_id_empresa: int
+
+    @classmethod
+    def from_model(cls, usuario) -> "UsuarioSnapshot":
+        return cls(
+            id_usuario=usuario.id_usuario,
+            auth_uid=usuario.auth_uid,
+            nombre=usuario.nombre,
+            apellido=usuario.apellido,
+            email=usuario.email,
+            es_dueno=usuario.es_dueno,
+            estado=usuario.estado,
+            fecha_creacion=usuario.fecha_creacion,
+            empresas_id_empresa=usuario.empresas_id_empresa,
+        )
+
+
+@dataclass(frozen=True)
+class EmpresaSnapshot:
+    """Immutable copy of an `Empresa` row."""
+    id_empresa: int
+    nombre: str
+    razon_social: str
+    nit: str
+    telefono: Optional[str]
+    email: Optional[str]
+    direccion: Optional[str]
+    estado: bool
+    fecha_creacion: Optional[datetime]
+
+    @classmethod
+    def from_model(cls, empresa) -> "EmpresaSnapshot":
+        return cls(
+            id_empresa=empresa.id_empresa,
+            nombre=empresa.nombre,
+            razon_social=empresa.razon_social,
+            nit=empresa.nit,
+            telefono=empresa.telefono,
+            email=empresa.email,
+            direccion=empresa.direccion,
+            estado=empresa.estado,
+            fecha_creacion=empresa.fecha_creacion,
+        )
+
+
+@dataclass(frozen=True)
+class RolSnapshot:
+    """Immutable copy of a `Rol` row."""
+    id_rol: int
+    nombre: str
+    descripcion: Optional[str]
+
+    @classmethod
+    def from_model(cls, rol) -> "RolSnapshot":
+        return cls(id_rol=rol.id_rol, nombre=rol.nombre, descripcion=rol.descripcion)
+
+
+@dataclass(frozen=True)
+class PermisoSnapshot:
+    """Immutable copy of a `Permiso` row."""
+    id_permiso: int
+    accion: str
+    recurso: str
+
+    @classmethod
+    def from_model(cls, permiso) -> "PermisoSnapshot":
+        return cls(id_permiso=permiso.id_permiso, accion=permiso.accion, recurso=permiso.recurso)
+
+
+def build_permission_index(permisos: Iterable[PermisoSnapshot]) -> FrozenSet[Tuple[str, str]]:
+    """Index permissions by (accion, recurso) for constant-time lookups."""
+    return frozenset(
+        (sys.intern(permiso.accion), sys.intern(permiso.recurso))
+        for permiso in permisos
+    )
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Everything needed to authorize a request for one authenticated user."""
+    usuario: UsuarioSnapshot
+    empresa: Optional[EmpresaSnapshot]
+    roles: Tuple[RolSnapshot, ...]
+    permisos: Tuple[PermisoSnapshot, ...]
+    # (company, permission catalog) change counters read with the principal; used for /auth/me ETags
+    versiones: Tuple[int, int] = (0, 0)
+    # Built once per load, shared by every request served from the cache
+    permission_index: FrozenSet[Tuple[str, str]] = field(init=False, repr=False, compare=False)
+    # "accion:recurso,..." (sorted) for the forward-auth X-Permissions header
+    permissions_header: str = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        index = build_permission_index(self.permisos)
+        object.__setattr__(self, "permission_index", index)
+        object.__setattr__(
+            self,
+            "permissions_header",
+            ",".join(sorted(f"{accion}:{recurso}" for accion, recurso in index)),
+        )
+
+
+class PrincipalCache:
+    """
+    Bounded LRU cache of principals keyed by `auth_uid`, with a TTL.
+
+    Invalidation is process-local: other workers only see a change once their
+    entry expires, so the TTL is the upper bound on cross-worker staleness.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[UUID, Tuple[float, Principal]]" = OrderedDict()
+        self._by_empresa: Dict[int, Set[UUID]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, auth_uid: UUID) -> Optional[Principal]:
+        """Return the cached principal, or None if missing or expired."""
+        entry = self._entries.get(auth_uid)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, principal = entry
+        if time.monotonic() >= expires_at:
+            self._remove(auth_uid)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(auth_uid)
+        self.hits += 1
+        return principal
+
+    def set(self, auth_uid: UUID, principal: Principal) -> None:
+        """Store a principal, evicting the least recently used entries if full."""
+        if self.max_entries <= 0 or self.ttl_seconds <= 0:
+            return
+
+        self._remove(auth_uid)
+        self._entries[auth_uid] = (time.monotonic() + self.ttl_seconds, principal)
+        self._by_empresa.setdefault(principal.usuario.empresas_id_empresa, set()).add(auth_uid)
+
+        while len(self._entries) > self.max_entries:
+            oldest_uid = next(iter(self._entries))
+            self._remove(oldest_uid)
+            self.evictions += 1
+
+    def invalidate(self, auth_uid: UUID) -> None:
+        """Drop the entry for one user."""
+        if self._remove(auth_uid):
+            self.invalidations += 1
+
+    def invalidate_empresa(self, id_empresa: int) -> None:
+        """Drop every entry belonging to a company (role or company changes)."""
+        for auth_uid in list(self._by_empresa.get(id_empresa, ())):
+            self.invalidate(auth_uid)
+
+    def clear(self) -> None:
+        """Drop every entry (global permission catalog changes)."""
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+        self._by_empresa.clear()
+
+    def stats(self) -> dict:
+        """Counters for monitoring."""
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+    def _remove(self, auth_uid: UUID) -> bool:
+        entry = self._entries.pop(auth_uid, None)
+        if entry is None:
+            return False
+
+        id_empresa = entry[1].usuario.empresas_id_empresa
+        uids = self._by_empresa.get(id_empresa)
+        if uids is not None:
+            uids.discard(auth_uid)
+            if not uids:
+                del self._by_empresa[id_empresa]
+        return True
+
+
+principal_cache = PrincipalCache(
+    max_entries=settings.principal_cache_max_entries,
+    ttl_seconds=settings.principal_cache_ttl_seconds,
+)
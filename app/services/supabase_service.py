@@ -1,16 +1,84 @@
-from supabase import create_client, Client
+from typing import Optional
+
+import httpx
+from supabase import acreate_client, AsyncClient, AsyncClientOptions
 from app.config import get_settings
 
 settings = get_settings()
 
+# Process-wide clients, created in the application lifespan (see app.main).
+# Both share one pooled keep-alive HTTP transport.
+_http_client: Optional[httpx.AsyncClient] = None
+_admin_client: Optional[AsyncClient] = None
+_auth_client: Optional[AsyncClient] = None
+
+
+def _client_options() -> AsyncClientOptions:
+    return AsyncClientOptions(
+        auto_refresh_token=False,
+        persist_session=False,
+        httpx_client=_http_client,
+    )
+
+
+async def init_supabase_clients() -> None:
+    """Create the shared HTTP pool and Supabase clients. Called on startup."""
+    global _http_client, _admin_client, _auth_client
+    
+    if _http_client is not None:
+        return
+    
+    _http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=settings.supabase_max_connections,
+            max_keepalive_connections=settings.supabase_max_keepalive_connections,
+            keepalive_expiry=settings.supabase_keepalive_expiry_seconds,
+        ),
+        timeout=httpx.Timeout(settings.supabase_timeout_seconds),
+    )
+    # Admin client: service role operations only, never signs anyone in
+    _admin_client = await acreate_client(
+        settings.supabase_url,
+        settings.supabase_service_role_key,
+        options=_client_options(),
+    )
+    # Auth client: sign-in and token operations. Kept separate because a
+    # successful sign-in rewrites the client's Authorization header, which
+    # must never leak into admin calls.
+    _auth_client = await acreate_client(
+        settings.supabase_url,
+        settings.supabase_service_role_key,
+        options=_client_options(),
+    )
+
+
+async def close_supabase_clients() -> None:
+    """Close the shared HTTP pool. Called on shutdown."""
+    global _http_client, _admin_client, _auth_client
+    
+    if _http_client is not None:
+        await _http_client.aclose()
+    _http_client = None
+    _admin_client = None
+    _auth_client = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Get the shared pooled HTTP client."""
+    if _http_client is None:
+        raise RuntimeError("Supabase clients are not initialized (application lifespan not started)")
+    return _http_client
 
-def get_supabase_client() -> Client:
-    """Get Supabase client with service role key."""
-    return create_client(settings.supabase_url, settings.supabase_service_role_key)
 
+def get_supabase_client() -> AsyncClient:
+    """Get Supabase client with service role key (admin operations)."""
+    if _admin_client is None:
+        raise RuntimeError("Supabase clients are not initialized (application lifespan not started)")
+    return _admin_client
 
-def get_supabase_auth_client() -> Client:
-    """Get Supabase client for authentication."""
-    # For auth operations, we can use the service role client
-    return get_supabase_client()
 
+def get_supabase_auth_client() -> AsyncClient:
+    """Get Supabase client for authentication (sign-in, token validation)."""
+    if _auth_client is None:
+        raise RuntimeError("Supabase clients are not initialized (application lifespan not started)")
+    return _auth_client
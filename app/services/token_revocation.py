@@ -0,0 +1,207 @@
+import asyncio
+import hashlib
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+from uuid import UUID
+
+import jwt
+from sqlalchemy import select, delete, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import get_settings
+from app.database import AsyncSessionLocal, after_commit
+from app.models.token_revocado import TokenRevocado
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Rows committed slightly out of order (now() is the transaction start) are
+# caught by re-reading this much history on every incremental sync
+_SYNC_OVERLAP = timedelta(seconds=30)
+
+
+def token_hash(access_token: str) -> str:
+    """Denylist key of an access token."""
+    return hashlib.sha256(access_token.encode()).hexdigest()
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over sha256 hex digests.
+
+    The keys are already uniformly distributed, so the bit positions are
+    taken straight from slices of the digest instead of extra hashing.
+    """
+
+    HASHES = 7  # ~1% false positives at 10 bits per entry
+
+    def __init__(self, capacity: int):
+        self.capacity = max(capacity, 1024)
+        self.size = self.capacity * 10
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        for i in range(self.HASHES):
+            yield int(key[i * 8:(i + 1) * 8], 16) % self.size
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationList:
+    """
+    In-process mirror of the `tokens_revocados` denylist.
+
+    `is_revoked` never touches the database: a Bloom filter answers the
+    common "not revoked" case, and a dict of hash -> expiry confirms hits.
+    Other workers' revocations arrive with the periodic sync, so
+    REVOCATION_SYNC_INTERVAL_SECONDS bounds how long a revoked token keeps
+    working on another worker.
+    """
+
+    def __init__(self):
+        self._expiry: Dict[str, float] = {}  # token hash -> exp (unix time)
+        self._bloom = BloomFilter(0)
+        self._last_sync: Optional[datetime] = None
+        self.checks = 0
+        self.bloom_hits = 0
+        self.revoked_hits = 0
+
+    def add(self, key: str, expires_at: float) -> None:
+        if expires_at <= time.time():
+            return
+        self._expiry[key] = expires_at
+        if len(self._expiry) > self._bloom.capacity:
+            self._rebuild()
+        else:
+            self._bloom.add(key)
+
+    def is_revoked(self, access_token: str) -> bool:
+        """O(1) check for the request hot path."""
+        self.checks += 1
+        key = token_hash(access_token)
+        if key not in self._bloom:
+            return False
+        self.bloom_hits += 1
+        expires_at = self._expiry.get(key)
+        if expires_at is None:
+            return False  # Bloom false positive
+        if expires_at <= time.time():
+            return False  # The token has expired anyway
+        self.revoked_hits += 1
+        return True
+
+    def purge_expired(self) -> None:
+        """Forget expired entries and rebuild the filter without them."""
+        now = time.time()
+        expired = [key for key, expires_at in self._expiry.items() if expires_at <= now]
+        if not expired:
+            return
+        for key in expired:
+            del self._expiry[key]
+        self._rebuild()
+
+    def _rebuild(self) -> None:
+        bloom = BloomFilter(len(self._expiry) * 2)
+        for key in self._expiry:
+            bloom.add(key)
+        self._bloom = bloom
+
+    async def sync(self, db: AsyncSession) -> int:
+        """Load revocations committed since the last sync (all live ones on the first call)."""
+        query = select(
+            TokenRevocado.token_hash,
+            TokenRevocado.expira_en,
+            TokenRevocado.fecha_revocacion,
+        ).where(TokenRevocado.expira_en > func.now())
+        if self._last_sync is not None:
+            query = query.where(TokenRevocado.fecha_revocacion > self._last_sync - _SYNC_OVERLAP)
+
+        rows = (await db.execute(query)).all()
+        for key, expira_en, fecha_revocacion in rows:
+            self.add(key, expira_en.timestamp())
+            if self._last_sync is None or fecha_revocacion > self._last_sync:
+                self._last_sync = fecha_revocacion
+        if self._last_sync is None:
+            # Empty denylist: next syncs only need rows newer than now
+            self._last_sync = datetime.now(timezone.utc)
+        self.purge_expired()
+        return len(rows)
+
+    def stats(self) -> dict:
+        """Counters for monitoring."""
+        return {
+            "size": len(self._expiry),
+            "checks": self.checks,
+            "bloom_hits": self.bloom_hits,
+            "revoked_hits": self.revoked_hits,
+        }
+
+
+revocation_list = RevocationList()
+
+
+async def revoke_token(db: AsyncSession, access_token: str) -> None:
+    """
+    Add an access token to the denylist until its `exp`. Does not commit;
+    this worker's in-process list is updated once the transaction commits.
+    """
+    try:
+        claims = jwt.decode(access_token, options={"verify_signature": False})
+        expires_at = float(claims["exp"])
+    except (jwt.PyJWTError, KeyError, TypeError, ValueError):
+        return  # Not a readable JWT: it cannot authenticate anyway
+    if expires_at <= time.time():
+        return
+
+    try:
+        auth_uid = UUID(claims.get("sub"))
+    except (TypeError, ValueError):
+        auth_uid = None
+
+    key = token_hash(access_token)
+    await db.execute(
+        insert(TokenRevocado)
+        .values(
+            token_hash=key,
+            auth_uid=auth_uid,
+            expira_en=datetime.fromtimestamp(expires_at, tz=timezone.utc),
+        )
+        .on_conflict_do_nothing(index_elements=[TokenRevocado.token_hash])
+    )
+    after_commit(db, revocation_list.add, key, expires_at)
+
+
+async def purge_expired_rows(db: AsyncSession) -> None:
+    """Delete denylist rows whose tokens have expired. Does not commit."""
+    await db.execute(delete(TokenRevocado).where(TokenRevocado.expira_en <= func.now()))
+
+
+async def run_sync() -> None:
+    """One sync pass in its own session."""
+    async with AsyncSessionLocal() as session:
+        await revocation_list.sync(session)
+
+
+async def revocation_sync_loop(interval_seconds: float) -> None:
+    """Background task: keep the in-process denylist in step with Postgres."""
+    purge_every = max(1, int(300 / interval_seconds))  # Purge rows about every 5 minutes
+    iteration = 0
+    while True:
+        try:
+            await run_sync()
+            iteration += 1
+            if iteration % purge_every == 0:
+                async with AsyncSessionLocal() as session:
+                    await purge_expired_rows(session)
+                    await session.commit()
+        except Exception as e:
+            logger.warning(f"Token denylist sync failed: {e}")
+        await asyncio.sleep(interval_seconds)
@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from uuid import UUID
+
+import jwt
+from fastapi import HTTPException, status
+
+from app.config import get_settings
+from app.services.supabase_service import get_http_client, get_supabase_auth_client
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+_SYMMETRIC_ALGORITHMS = {"HS256"}
+_ASYMMETRIC_ALGORITHMS = {"RS256", "ES256"}
+
+# Minimum time between two JWKS downloads triggered by unknown key ids,
+# so a flood of tokens with a bogus "kid" cannot hammer the JWKS endpoint.
+_JWKS_MIN_REFRESH_INTERVAL = 30.0
+
+
+class LocalVerificationUnavailable(Exception):
+    """Raised when a token cannot be checked locally (not when it is invalid)."""
+
+
+class JWKSCache:
+    """Signing keys from the Supabase JWKS endpoint, refreshed periodically."""
+
+    def __init__(self, url: str, ttl_seconds: int):
+        self.url = url
+        self.ttl_seconds = ttl_seconds
+        self._keys: Dict[str, jwt.PyJWK] = {}
+        self._fetched_at = 0.0
+        self._last_attempt = 0.0
+        self._lock = asyncio.Lock()
+
+    def _is_fresh(self) -> bool:
+        return time.monotonic() - self._fetched_at < self.ttl_seconds
+
+    async def get_key(self, kid: Optional[str]) -> Optional[jwt.PyJWK]:
+        """Return the key for `kid`, downloading the key set when stale or unknown."""
+        if kid in self._keys and self._is_fresh():
+            return self._keys[kid]
+
+        async with self._lock:
+            # Another request may have refreshed the set while we waited
+            if kid in self._keys and self._is_fresh():
+                return self._keys[kid]
+            if time.monotonic() - self._last_attempt >= _JWKS_MIN_REFRESH_INTERVAL:
+                await self._refresh()
+
+        return self._keys.get(kid)
+
+    async def _refresh(self) -> None:
+        self._last_attempt = time.monotonic()
+        try:
+            response = await get_http_client().get(self.url, timeout=5.0)
+            response.raise_for_status()
+            jwk_set = jwt.PyJWKSet.from_dict(response.json())
+        except Exception as e:
+            # Keep serving the previous keys; stale keys are better than none
+            logger.warning(f"Could not refresh JWKS from {self.url}: {e}")
+            return
+
+        self._keys = {key.key_id: key for key in jwk_set.keys if key.key_id}
+        self._fetched_at = time.monotonic()
+
+
+jwks_cache = JWKSCache(settings.jwt_jwks_url, settings.jwt_jwks_cache_ttl_seconds)
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU of tokens that passed local verification, kept until `exp`.
+
+    Signature and claim checks are deterministic for a given token, so only
+    expiry has to be re-checked. Revocation is checked separately (denylist),
+    before verification.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[UUID, float]]" = OrderedDict()  # token -> (auth_uid, exp)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, access_token: str) -> Optional[UUID]:
+        entry = self._entries.get(access_token)
+        if entry is None:
+            self.misses += 1
+            return None
+        auth_uid, expires_at = entry
+        if time.time() >= expires_at:
+            del self._entries[access_token]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(access_token)
+        self.hits += 1
+        return auth_uid
+
+    def set(self, access_token: str, auth_uid: UUID, expires_at: float) -> None:
+        if self.max_entries <= 0:
+            return
+        self._entries[access_token] = (auth_uid, expires_at)
+        self._entries.move_to_end(access_token)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        """Counters for monitoring."""
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+verified_tokens = VerifiedTokenCache(settings.verified_token_cache_max_entries)
+
+
+def _invalid_token(detail: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+    )
+
+
+async def _verify_local(access_token: str) -> UUID:
+    """Verify signature, exp/nbf/aud and return the `sub` claim."""
+    try:
+        header = jwt.get_unverified_header(access_token)
+    except jwt.PyJWTError:
+        raise _invalid_token("Invalid authentication credentials")
+
+    algorithm = header.get("alg")
+    if algorithm in _SYMMETRIC_ALGORITHMS:
+        key = settings.jwt_secret
+    elif algorithm in _ASYMMETRIC_ALGORITHMS:
+        jwk = await jwks_cache.get_key(header.get("kid"))
+        if jwk is None:
+            raise LocalVerificationUnavailable(f"No signing key for kid {header.get('kid')!r}")
+        key = jwk.key
+    else:
+        raise LocalVerificationUnavailable(f"Unsupported token algorithm {algorithm!r}")
+
+    try:
+        claims = jwt.decode(
+            access_token,
+            key=key,
+            algorithms=[algorithm],
+            audience=settings.jwt_audience,
+            leeway=settings.jwt_leeway_seconds,
+            options={"require": ["exp", "sub"]},
+        )
+    except jwt.ExpiredSignatureError:
+        raise _invalid_token("Token has expired")
+    except jwt.PyJWTError:
+        raise _invalid_token("Invalid authentication credentials")
+
+    try:
+        auth_uid = UUID(claims["sub"])
+    except (TypeError, ValueError):
+        raise _invalid_token("Invalid authentication credentials")
+
+    verified_tokens.set(access_token, auth_uid, float(claims["exp"]) + settings.jwt_leeway_seconds)
+    return auth_uid
+
+
+def expires_within(access_token: str, seconds: float) -> bool:
+    """
+    Whether the token's `exp` is less than `seconds` away.
+    
+    Reads the claim without checking the signature (verification happens
+    afterwards); unreadable tokens count as expiring.
+    """
+    try:
+        claims = jwt.decode(access_token, options={"verify_signature": False})
+        return float(claims["exp"]) - time.time() < seconds
+    except (jwt.PyJWTError, KeyError, TypeError, ValueError):
+        return True
+
+
+async def _verify_remote(access_token: str) -> UUID:
+    """Ask Supabase Auth to validate the token."""
+    supabase = get_supabase_auth_client()
+    user_response = await supabase.auth.get_user(access_token)
+
+    if not user_response or not user_response.user:
+        raise _invalid_token("Invalid authentication credentials")
+
+    return UUID(user_response.user.id)
+
+
+async def verify_access_token(access_token: str) -> UUID:
+    """
+    Validate a Supabase access token and return its `auth_uid`.
+
+    In "local" mode the token is checked in-process; Supabase is only contacted
+    when the token cannot be checked locally and JWT_REMOTE_FALLBACK is enabled.
+    """
+    if settings.jwt_verification_mode == "remote":
+        return await _verify_remote(access_token)
+
+    auth_uid = verified_tokens.get(access_token)
+    if auth_uid is not None:
+        return auth_uid
+
+    try:
+        return await _verify_local(access_token)
+    except LocalVerificationUnavailable as e:
+        if not settings.jwt_remote_fallback:
+            raise _invalid_token(f"Could not validate credentials: {e}")
+        logger.info(f"Falling back to remote token validation: {e}")
+        return await _verify_remote(access_token)
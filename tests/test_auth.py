@@ -0,0 +1,39 @@
+from fastapi import Request
+from fastapi.testclient import TestClient
+
+from app.deps import get_current_user
+from app.main import app
+from app.routers import auth
+
+
+def test_logout_revokes_the_bearer_token(monkeypatch, no_db):
+    revoked, signed_out = [], []
+
+    async def fake_revoke_token(db, access_token):
+        revoked.append(access_token)
+
+    async def fake_logout(access_token):
+        signed_out.append(access_token)
+
+    async def bearer_user(request: Request):
+        request.state.access_token = "bearer-token"
+        return object()
+
+    monkeypatch.setattr(auth, "revoke_token", fake_revoke_token)
+    monkeypatch.setattr(auth, "logout", fake_logout)
+    app.dependency_overrides[get_current_user] = bearer_user
+    response = TestClient(app).post("/auth/logout", headers={"Authorization": "Bearer bearer-token"})
+
+    assert response.status_code == 200
+    assert revoked == ["bearer-token"]
+    assert signed_out == ["bearer-token"]
+
+
+def test_logout_without_an_authenticated_token_fails(no_db):
+    async def user_without_token():
+        return object()
+
+    app.dependency_overrides[get_current_user] = user_without_token
+    response = TestClient(app).post("/auth/logout")
+
+    assert response.status_code == 401
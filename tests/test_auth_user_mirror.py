@@ -0,0 +1,72 @@
+import asyncio
+import os
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.database import _to_async_url
+from app.models.auth_usuario import AuthUsuario
+from app.services import auth_user_mirror
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="needs TEST_DATABASE_URL (PostgreSQL)")
+
+
+class _FakeAdmin:
+    def __init__(self, users):
+        self.users = users
+
+    async def list_users(self, page, per_page):
+        return self.users[(page - 1) * per_page:page * per_page]
+
+
+def _supabase_with(users):
+    return SimpleNamespace(auth=SimpleNamespace(admin=_FakeAdmin(users)))
+
+
+async def _reconcile_after_email_swap(monkeypatch):
+    engine = create_async_engine(_to_async_url(TEST_DATABASE_URL, "TEST_DATABASE_URL"))
+    async with engine.begin() as conn:
+        await conn.run_sync(AuthUsuario.__table__.drop, checkfirst=True)
+        await conn.run_sync(AuthUsuario.__table__.create)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    user_a, user_b = uuid4(), uuid4()
+    try:
+        async with session_factory() as db:
+            await auth_user_mirror.upsert_auth_users(db, [
+                {"auth_uid": user_a, "email": "shared@example.com"},
+                {"auth_uid": user_b, "email": "b@example.com"},
+            ])
+            await db.commit()
+
+        # Outside this service: A moved to a new email and B took A's old one.
+        # B is listed first, so its upsert meets A's stale row.
+        monkeypatch.setattr(auth_user_mirror.settings, "auth_mirror_page_size", 1)
+        monkeypatch.setattr(auth_user_mirror, "get_supabase_client", lambda: _supabase_with([
+            SimpleNamespace(id=str(user_b), email="Shared@example.com"),
+            SimpleNamespace(id=str(user_a), email="a-new@example.com"),
+        ]))
+        async with session_factory() as db:
+            assert await auth_user_mirror.reconcile_auth_users(db) == 2
+
+        async with session_factory() as db:
+            rows = dict((await db.execute(select(AuthUsuario.auth_uid, AuthUsuario.email))).all())
+            holder = await auth_user_mirror.find_auth_user_by_email(db, "shared@example.com")
+    finally:
+        async with engine.begin() as conn:
+            await conn.run_sync(AuthUsuario.__table__.drop, checkfirst=True)
+        await engine.dispose()
+
+    return rows, holder, user_a, user_b
+
+
+def test_reconcile_survives_an_email_moving_between_users(monkeypatch):
+    rows, holder, user_a, user_b = asyncio.run(_reconcile_after_email_swap(monkeypatch))
+
+    assert rows == {user_b: "Shared@example.com", user_a: "a-new@example.com"}
+    assert holder.auth_uid == user_b
@@ -0,0 +1,14 @@
+import asyncio
+
+from app.services.bulk_import_service import import_usuarios
+
+
+def test_malformed_row_is_reported_not_raised():
+    # Rejected by schema validation before any database access
+    results = asyncio.run(import_usuarios([{"email": 123, "nombre": "a"}], 1, None))
+
+    assert len(results) == 1
+    assert results[0].fila == 1
+    assert results[0].email is None
+    assert not results[0].creado
+    assert "email" in results[0].error
@@ -0,0 +1,51 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.services.claims_token import PermissionCatalog, decode_permissions, encode_permissions
+
+
+class _Row(tuple):
+    def __new__(cls, id_permiso, accion, recurso, version):
+        return super().__new__(cls, (id_permiso, accion, recurso, version))
+
+    @property
+    def version(self):
+        return self[3]
+
+
+class CatalogSession:
+    """Answers the catalog query with fixed (id_permiso, accion, recurso, version) rows."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = 0
+
+    async def execute(self, statement):
+        self.queries += 1
+        return SimpleNamespace(all=lambda: self.rows)
+
+
+def test_bits_are_dense_catalog_positions():
+    session = CatalogSession([_Row(id_permiso, "read", f"r{id_permiso}", 7) for id_permiso in (3, 500, 9000)])
+    catalog = asyncio.run(PermissionCatalog().load(session, 7))
+
+    encoded = encode_permissions([SimpleNamespace(id_permiso=9000), SimpleNamespace(id_permiso=42)], catalog.positions)
+
+    assert catalog.version == 7
+    assert [entry["bit"] for entry in catalog.permisos] == [0, 1, 2]
+    # Bit 2, not bit 9000; the unknown permission is left out
+    assert decode_permissions(encoded) == 0b100
+    assert len(encoded) == 2
+
+
+def test_catalog_reloads_only_for_a_newer_version():
+    session = CatalogSession([_Row(1, "read", "usuarios", 4)])
+    catalog = PermissionCatalog()
+
+    asyncio.run(catalog.load(session, 4))
+    asyncio.run(catalog.load(session, 3))
+    asyncio.run(catalog.load(session, 4))
+    assert session.queries == 1
+
+    asyncio.run(catalog.load(session, 5))
+    assert session.queries == 2
@@ -0,0 +1,68 @@
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from app import database
+from app.database import after_commit, after_rollback, get_db
+
+
+class FailingCommitSession:
+    """Stands in for an AsyncSession whose COMMIT fails (e.g. a constraint violation)."""
+
+    def __init__(self):
+        self.info = {}
+        self.rolled_back = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    def in_transaction(self) -> bool:
+        return True
+
+    async def commit(self):
+        raise RuntimeError("commit failed")
+
+    async def rollback(self):
+        self.rolled_back = True
+
+
+def test_commit_failure_is_a_server_error(monkeypatch):
+    session = FailingCommitSession()
+    monkeypatch.setattr(database, "AsyncSessionLocal", lambda: session)
+    callbacks = []
+
+    app = FastAPI()
+
+    @app.post("/items", status_code=201)
+    async def create_item(db=Depends(get_db, scope="function")):
+        after_commit(db, callbacks.append, "committed")
+        return {"ok": True}
+
+    client = TestClient(app, raise_server_exceptions=False)
+    response = client.post("/items")
+
+    assert response.status_code == 500
+    assert session.rolled_back
+    assert callbacks == []
+
+
+def test_commit_failure_runs_rollback_compensation(monkeypatch):
+    monkeypatch.setattr(database, "AsyncSessionLocal", FailingCommitSession)
+    compensated = []
+
+    async def compensate(auth_uids):
+        compensated.extend(auth_uids)
+
+    app = FastAPI()
+
+    @app.post("/items", status_code=201)
+    async def create_item(db=Depends(get_db, scope="function")):
+        after_rollback(db, compensate, ["auth-uid"])
+        return {"ok": True}
+
+    response = TestClient(app, raise_server_exceptions=False).post("/items")
+
+    assert response.status_code == 500
+    assert compensated == ["auth-uid"]
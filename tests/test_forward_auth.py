@@ -0,0 +1,61 @@
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+
+from fastapi.testclient import TestClient
+
+from app import deps
+from app.main import app
+from app.routers import auth
+from app.services.principal_cache import principal_cache
+
+
+class DummySession:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+def test_verify_answers_401_for_a_valid_token_without_a_user(monkeypatch):
+    async def verified(access_token):
+        return uuid4()
+
+    async def no_principal(auth_uid, db):
+        return None
+
+    monkeypatch.setattr(deps, "_verify_not_revoked", verified)
+    monkeypatch.setattr(deps, "_load_and_cache_principal", no_principal)
+    monkeypatch.setattr(deps, "ReadSessionLocal", DummySession)
+    misses = principal_cache.misses
+
+    response = TestClient(app).get("/auth/verify", headers={"Authorization": "Bearer token"})
+
+    assert response.status_code == 401
+    assert principal_cache.misses == misses + 1
+
+
+@pytest.mark.parametrize("enabled", [True, False])
+def test_verify_permissions_header_can_be_turned_off(monkeypatch, enabled):
+    principal = SimpleNamespace(
+        usuario=SimpleNamespace(id_usuario=1, empresas_id_empresa=2, es_dueno=False),
+        permission_index={("read", "usuarios")},
+        permissions_header="read:usuarios",
+    )
+
+    async def cached_principal(access_token):
+        return principal
+
+    monkeypatch.setattr(auth, "get_principal_for_token", cached_principal)
+    monkeypatch.setattr(auth.settings, "forward_auth_permissions_header", enabled)
+
+    response = TestClient(app).get(
+        "/auth/verify",
+        headers={"Authorization": "Bearer token", "X-Required-Permission": "read:usuarios"},
+    )
+
+    assert response.status_code == 204
+    assert response.headers["x-user-id"] == "1"
+    assert ("x-permissions" in response.headers) is enabled
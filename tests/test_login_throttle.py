@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+from supabase import AuthApiError, AuthRetryableError
+
+from app.main import app
+from app.routers import auth
+from app.services import auth_service, login_throttle as login_throttle_module
+from app.services.login_throttle import client_ip, login_throttle
+
+
+def _request(forwarded_for: str, peer: str = "10.0.0.2") -> Request:
+    return Request({
+        "type": "http",
+        "headers": [(b"x-forwarded-for", forwarded_for.encode())],
+        "client": (peer, 12345),
+    })
+
+
+def test_client_ip_ignores_forwarded_for_by_default():
+    assert client_ip(_request("6.6.6.6")) == "10.0.0.2"
+
+
+def test_client_ip_ignores_client_supplied_entries(monkeypatch):
+    monkeypatch.setattr(login_throttle_module.settings, "login_trusted_proxy_count", 1)
+    # The client sent "6.6.6.6"; the trusted proxy appended the address it saw
+    assert client_ip(_request("6.6.6.6, 203.0.113.7")) == "203.0.113.7"
+
+
+def test_client_ip_falls_back_to_the_peer_with_too_few_entries(monkeypatch):
+    monkeypatch.setattr(login_throttle_module.settings, "login_trusted_proxy_count", 2)
+    assert client_ip(_request("203.0.113.7")) == "10.0.0.2"
+
+
+class _FailingAuth:
+    def __init__(self, error: Exception):
+        self.error = error
+
+    async def sign_in_with_password(self, credentials):
+        raise self.error
+
+
+class _FailingClient:
+    def __init__(self, error: Exception):
+        self.auth = _FailingAuth(error)
+
+
+@pytest.mark.parametrize(
+    "error, status_code",
+    [
+        (AuthApiError("Invalid login credentials", 400, "invalid_credentials"), 401),
+        (AuthApiError("Internal error", 500, None), 503),
+        (AuthRetryableError("Gateway timeout", 504), 502),
+        (TimeoutError("timed out"), 502),
+    ],
+)
+def test_login_separates_bad_credentials_from_upstream_errors(monkeypatch, error, status_code):
+    monkeypatch.setattr(auth_service, "get_supabase_auth_client", lambda: _FailingClient(error))
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(auth_service.login("ana@example.com", "secret"))
+    assert raised.value.status_code == status_code
+
+
+def test_upstream_outage_does_not_count_as_a_failed_login(monkeypatch, no_db):
+    async def unavailable(email, password):
+        raise HTTPException(status_code=503, detail="Authentication service unavailable")
+
+    monkeypatch.setattr(auth, "login", unavailable)
+    failures = login_throttle.failures
+    response = TestClient(app).post(
+        "/auth/login",
+        json={"email": "outage@example.com", "password": "secret"},
+    )
+
+    assert response.status_code == 503
+    assert login_throttle.failures == failures